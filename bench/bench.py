@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the build pipeline on synthetic corpora.
+
+Each run generates N posts in a scratch directory, puts fake `typst` and `pandoc`
+executables (bench/fake_typst.py, bench/fake_pandoc.py) first on PATH and times
+every stage of build.py separately, followed by end-to-end builds. Results are
+written as JSON so runs on different commits can be compared:
+
+    python3 bench/bench.py --sizes 10,100,1000 --output before.json
+    python3 bench/bench.py --sizes 10,100,1000 --output after.json
+    python3 bench/bench.py --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+
+WORDS = (
+    "space homotopy group fiber bundle sheaf category functor limit colimit topology "
+    "manifold chain complex cycle boundary kernel image exact sequence module ring field "
+    "proof lemma theorem remark example definition construction the of and a is we let"
+).split()
+MATH = [
+    "x", "n in NN", "e^(i pi) + 1 = 0", "f: X -> Y", "pi_1(S^1) tilde.eq ZZ",
+    "sum_(k=0)^n binom(n, k) = 2^n", "H_n (X; ZZ)", "a^2 + b^2 = c^2",
+    " integral_0^infinity e^(-x^2) dif x = sqrt(pi) / 2 ",
+]
+TAGS = [f"tag-{i}" for i in range(50)]
+INTERACTIVE = ["p5-sketch", "three-cube", "my-viz"]
+
+
+def generate_post(rng, index, options):
+    """Returns the Typst source for one synthetic post."""
+    tags = rng.sample(TAGS[:max(options.tag_pool, 1)], min(options.tags, options.tag_pool))
+    lines = [
+        f'#set document(title: "Post {index}", date: datetime(year: {2000 + index % 25}, month: {1 + index % 12}, day: {1 + index % 28}))',
+        f"// tags: {', '.join(tags)}",
+        f"// abstract: Synthetic post number {index} about {' '.join(rng.choices(WORDS, k=8))}.",
+        "",
+    ]
+
+    size = 0
+    section = 0
+    embeds = options.interactive
+    while size < options.post_bytes:
+        level = 1 + section % max(options.heading_depth, 1)
+        heading = "=" * level + f" Section {section} {rng.choice(WORDS)}"
+        lines.append(heading)
+        section += 1
+
+        for _ in range(3):
+            sentence_words = []
+            for _ in range(rng.randint(20, 60)):
+                if rng.random() < options.math_density:
+                    sentence_words.append(f"${rng.choice(MATH)}$")
+                else:
+                    sentence_words.append(rng.choice(WORDS))
+            paragraph = " ".join(sentence_words) + "."
+            lines.extend(["", paragraph, ""])
+            size += len(paragraph) + len(heading)
+
+        if embeds:
+            lines.extend([f"[INTERACTIVE:{INTERACTIVE[embeds % len(INTERACTIVE)]}]", ""])
+            embeds -= 1
+        if section % 4 == 0:
+            lines.extend(["```python", "print('[INTERACTIVE:p5-sketch]')", "```", ""])
+
+    return "\n".join(lines) + "\n"
+
+
+def generate_corpus(root, posts, options):
+    """Creates a site tree with `posts` synthetic posts plus the real templates and assets."""
+    rng = random.Random(options.seed)
+    for name in ("templates", "static", "interactive"):
+        shutil.copytree(REPO_DIR / name, root / name)
+    (root / "content" / "pages").mkdir(parents=True)
+    shutil.copy(REPO_DIR / "content" / "pages" / "home.typ", root / "content" / "pages" / "home.typ")
+
+    blog = root / "content" / "blog"
+    blog.mkdir(parents=True)
+    for index in range(posts):
+        (blog / f"post-{index:05d}.typ").write_text(generate_post(rng, index, options), encoding="utf-8")
+
+
+def install_fake_tools(bin_dir):
+    """Writes `typst` and `pandoc` launchers for the fake tools into bin_dir."""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for tool in ("typst", "pandoc"):
+        launcher = bin_dir / tool
+        launcher.write_text(
+            f"#!{sys.executable}\n"
+            "import sys\n"
+            f"sys.path.insert(0, {str(BENCH_DIR)!r})\n"
+            f"from fake_{tool} import main\n"
+            "sys.exit(main(sys.argv[1:]))\n",
+            encoding="utf-8",
+        )
+        launcher.chmod(0o755)
+
+
+@contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+class Timer:
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = round(self.stages.get(name, 0) + time.perf_counter() - start, 6)
+
+
+def reset_state(build):
+    """Drops the in-memory caches build.py keeps between builds in one process."""
+    build._math_memo.clear()
+    build._template_cache.clear()
+    build._digest_cache.clear()
+
+
+def run_stages(build, options):
+    """Times each pipeline stage in isolation, the way build.py runs them for the configured mode."""
+    timer = Timer()
+    reset_state(build)
+    typ_files = sorted(build.BLOG_DIR.glob("*.typ"))
+    sources = {typ_file: typ_file.read_text(encoding="utf-8") for typ_file in typ_files}
+
+    with timer.stage("metadata"):
+        metadata = {typ_file: build.parse_metadata(source) for typ_file, source in sources.items()}
+
+    math_maps = {}
+    with timer.stage("math"):
+        if options.mode == "typst-html":
+            for typ_file, source in sources.items():
+                sources[typ_file], math_maps[typ_file] = build.process_math(source)
+
+    raw_html = {}
+    with timer.stage("compile"):
+        for typ_file, source in sources.items():
+            if options.mode == "typst-html":
+                cmd = ["typst", "compile", "--features", "html", "--format", "html", "-", "-"]
+            else:
+                cmd = ["pandoc", "-f", "typst", "-t", "html", "--mathjax"]
+            raw_html[typ_file] = subprocess.run(cmd, input=source, capture_output=True, text=True, check=True).stdout
+
+    bodies = {}
+    with timer.stage("postprocess"):
+        for typ_file, html in raw_html.items():
+            if options.mode == "typst-html":
+                bodies[typ_file] = build.postprocess_typst_html(html, math_maps[typ_file])
+            else:
+                bodies[typ_file] = build.postprocess_pandoc_html(html)
+
+    with timer.stage("templating"):
+        for typ_file, body in bodies.items():
+            context = {"title": metadata[typ_file]["title"], "date": metadata[typ_file]["date"], "content": body, "show_title": True}
+            build.render_page("post.html", context)
+
+    posts = [
+        {**meta, "url": f"/blog/{typ_file.stem}/", "slug": typ_file.stem}
+        for typ_file, meta in metadata.items()
+    ]
+    build.load_build_manifest(clean=True)
+    build.clean_output()
+    (build.OUTPUT_DIR / "blog").mkdir()
+
+    with timer.stage("index"):
+        build.build_blog_index(posts)
+
+    with timer.stage("static"):
+        build.build_assets()
+
+    return timer.stages
+
+
+def run_end_to_end(build, options):
+    """Times full builds: cold, no-op incremental, and incremental after editing one post."""
+    timer = Timer()
+    jobs = ["--jobs", str(options.jobs)] if options.jobs else []
+    reset_state(build)
+
+    with timer.stage("clean_build"):
+        build.main(["--clean", "--no-cache", *jobs])
+    with timer.stage("noop_rebuild"):
+        build.main(jobs)
+
+    first_post = sorted(build.BLOG_DIR.glob("*.typ"))[0]
+    with open(first_post, "a", encoding="utf-8") as f:
+        f.write("\nOne more edited paragraph.\n")
+    with timer.stage("one_post_rebuild"):
+        build.main(jobs)
+
+    return timer.stages
+
+
+def configure_mode(build, mode):
+    build.USE_SVG_FOR_BLOG = False
+    build.USE_TYPST_HTML_FOR_BLOG = mode == "typst-html"
+    # Compiles must go through the fake CLI, not typst-py
+    build.TYPST_IN_PROCESS = False
+
+
+def bench_size(posts, options):
+    with tempfile.TemporaryDirectory(prefix="blog-bench-") as scratch:
+        root = Path(scratch)
+        generate_corpus(root / "site", posts, options)
+        install_fake_tools(root / "bin")
+        os.environ["PATH"] = f"{root / 'bin'}{os.pathsep}{os.environ['PATH']}"
+        os.environ["FAKE_TOOL_LATENCY_MS"] = str(options.latency_ms)
+
+        sys.path.insert(0, str(REPO_DIR))
+        import build
+
+        configure_mode(build, options.mode)
+        corpus_bytes = sum(path.stat().st_size for path in (root / "site" / "content").rglob("*.typ"))
+
+        with working_directory(root / "site"), open(os.devnull, "w") as devnull:
+            stdout = sys.stdout
+            sys.stdout = devnull
+            try:
+                stages = run_stages(build, options)
+                end_to_end = run_end_to_end(build, options)
+            finally:
+                sys.stdout = stdout
+
+        os.environ["PATH"] = os.environ["PATH"].split(os.pathsep, 1)[1]
+
+    return {
+        "posts": posts,
+        "corpus_bytes": corpus_bytes,
+        "stages": stages,
+        "end_to_end": end_to_end,
+        "ms_per_post": {name: round(seconds * 1000 / posts, 3) for name, seconds in {**stages, **end_to_end}.items()},
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    """Prints per-stage timings of two result files side by side."""
+    old = {run["posts"]: run for run in json.loads(Path(old_path).read_text())["runs"]}
+    new = {run["posts"]: run for run in json.loads(Path(new_path).read_text())["runs"]}
+
+    print(f"{'posts':>7}  {'stage':<18}{'old (s)':>10}{'new (s)':>10}{'ratio':>8}")
+    for posts in sorted(set(old) & set(new)):
+        for group in ("stages", "end_to_end"):
+            for name, new_seconds in new[posts][group].items():
+                old_seconds = old[posts][group].get(name)
+                if old_seconds is None:
+                    continue
+                ratio = new_seconds / old_seconds if old_seconds else float("inf")
+                flag = "  <-- slower" if ratio > 1.1 else ""
+                print(f"{posts:>7}  {name:<18}{old_seconds:>10.3f}{new_seconds:>10.3f}{ratio:>8.2f}{flag}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark build.py on synthetic corpora.")
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="comma-separated post counts (default: %(default)s)")
+    parser.add_argument("--post-bytes", type=int, default=4000, help="approximate text size of each post")
+    parser.add_argument("--math-density", type=float, default=0.05, help="probability that a word is a math expression")
+    parser.add_argument("--heading-depth", type=int, default=3, help="deepest heading level used")
+    parser.add_argument("--tags", type=int, default=3, help="tags per post")
+    parser.add_argument("--tag-pool", type=int, default=20, help="number of distinct tags")
+    parser.add_argument("--interactive", type=int, default=1, help="interactive embeds per post")
+    parser.add_argument("--latency-ms", type=float, default=0, help="extra latency of every fake typst/pandoc call")
+    parser.add_argument("--mode", choices=["typst-html", "pandoc"], default="typst-html", help="compile path to benchmark")
+    parser.add_argument("--jobs", type=int, default=None, help="--jobs passed to the end-to-end builds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="where to write the JSON results (default: stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.compare:
+        compare(*options.compare)
+        return
+
+    runs = []
+    for posts in (int(size) for size in options.sizes.split(",")):
+        print(f"Benchmarking {posts} posts...", file=sys.stderr)
+        runs.append(bench_size(posts, options))
+
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "options": {key: value for key, value in vars(options).items() if key not in ("output", "compare")},
+        },
+        "runs": runs,
+    }
+
+    text = json.dumps(results, indent=2)
+    if options.output:
+        Path(options.output).write_text(text + "\n", encoding="utf-8")
+        print(f"Wrote {options.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Stand-in for pandoc used by the benchmarks. Supports the two conversions build.py
+runs: `-f typst -t latex` for math (read from stdin) and `-f typst -t html` for pages.
+
+Set FAKE_TOOL_LATENCY_MS to add a fixed delay per invocation.
+"""
+import os
+import re
+import sys
+import time
+
+from fake_typst import typst_to_html
+
+VERSION = "pandoc 0.0.0 (fake)"
+
+
+def math_to_latex(source):
+    # Every paragraph that is a single $...$ expression becomes \(...\) or \[...\]
+    paragraphs = []
+    for paragraph in re.split(r'\n\s*\n', source.strip()):
+        match = re.fullmatch(r'\$(.+)\$', paragraph.strip(), re.DOTALL)
+        if not match:
+            paragraphs.append(paragraph.strip())
+            continue
+        inner = match.group(1)
+        if inner.startswith(" ") and inner.endswith(" "):
+            paragraphs.append(f"\\[{inner.strip()}\\]")
+        else:
+            paragraphs.append(f"\\({inner}\\)")
+    return "\n\n".join(paragraphs) + "\n"
+
+
+def page_to_html(source, toc):
+    html = typst_to_html(source)
+    body = html[html.index("<body>") + len("<body>"):html.index("</body>")]
+    body = re.sub(r'<span class="math">(.*?)</span>', r'<span class="math inline">\\(\1\\)</span>', body)
+
+    def add_id(match):
+        slug = re.sub(r'[^a-z0-9-]', '', re.sub(r'\s+', '-', re.sub(r'<[^>]+>', '', match.group(2)).lower().strip()))
+        return f'<h{match.group(1)} id="{slug}">{match.group(2)}</h{match.group(1)}>'
+
+    body = re.sub(r'<h([1-6])>(.*?)</h\1>', add_id, body)
+    if not toc:
+        return body
+    items = re.findall(r'<h[1-3] id="([^"]*)">(.*?)</h[1-3]>', body)
+    nav = "".join(f'<li><a href="#{slug}" id="toc-{slug}">{text}</a></li>\n' for slug, text in items)
+    return f'<nav id="TOC" role="doc-toc">\n<ul>\n{nav}</ul>\n</nav>\n{body}'
+
+
+def main(argv):
+    time.sleep(float(os.environ.get("FAKE_TOOL_LATENCY_MS", "0")) / 1000)
+
+    if argv and argv[0] in ("--version", "-v"):
+        print(VERSION)
+        return 0
+
+    to = "html"
+    toc = False
+    inputs = []
+    args = iter(argv)
+    for arg in args:
+        if arg in ("-t", "--to"):
+            to = next(args)
+        elif arg in ("-f", "--from"):
+            next(args)
+        elif arg == "--toc":
+            toc = True
+        elif not arg.startswith("-"):
+            inputs.append(arg)
+
+    source = "".join(open(path, encoding="utf-8").read() for path in inputs) if inputs else sys.stdin.read()
+    if source.count("(") != source.count(")"):
+        print("(line 1, column 1):\nunexpected end of input", file=sys.stderr)
+        return 64
+
+    sys.stdout.write(math_to_latex(source) if to == "latex" else page_to_html(source, toc))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
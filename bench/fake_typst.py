@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the typst CLI used by the benchmarks. It understands the subset of
+`typst compile` that build.py calls and turns a tiny part of Typst markup into
+plausible output, so runs are hermetic and work offline.
+
+Set FAKE_TOOL_LATENCY_MS to add a fixed delay per invocation.
+"""
+import os
+import re
+import sys
+import time
+
+VERSION = "typst 0.0.0 (fake)"
+
+
+def convert_inline(text):
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    text = re.sub(r'`([^`]*)`', r'<code>\1</code>', text)
+    text = re.sub(r'\*([^*]+)\*', r'<strong>\1</strong>', text)
+    return re.sub(r'\$([^$]+)\$', r'<span class="math">\1</span>', text)
+
+
+def typst_to_html(source):
+    body = []
+    paragraph = []
+    in_code = False
+
+    def flush():
+        if paragraph:
+            body.append(f"    <p>{convert_inline(' '.join(paragraph))}</p>")
+            paragraph.clear()
+
+    for line in source.splitlines():
+        if line.startswith("```"):
+            flush()
+            body.append("    </code></pre>" if in_code else "    <pre><code>")
+            in_code = not in_code
+        elif in_code:
+            body.append(line.replace("&", "&amp;").replace("<", "&lt;"))
+        elif line.startswith("#") or line.startswith("//"):
+            continue
+        elif line.startswith("="):
+            flush()
+            level = len(line) - len(line.lstrip("="))
+            body.append(f"    <h{level + 1}>{convert_inline(line[level:].strip())}</h{level + 1}>")
+        elif not line.strip():
+            flush()
+        else:
+            paragraph.append(line.strip())
+    flush()
+
+    return (
+        "<!DOCTYPE html>\n<html>\n  <head>\n    <meta charset=\"utf-8\">\n  </head>\n"
+        "  <body>\n" + "\n".join(body) + "\n  </body>\n</html>\n"
+    )
+
+
+def typst_to_svg(source, page):
+    words = len(source.split())
+    return (
+        f'<svg class="typst-doc" viewBox="0 0 595 842" width="595pt" height="842pt" xmlns="http://www.w3.org/2000/svg">'
+        f'<text x="10" y="20">page {page}: {words} words</text></svg>'
+    )
+
+
+def main(argv):
+    time.sleep(float(os.environ.get("FAKE_TOOL_LATENCY_MS", "0")) / 1000)
+
+    if argv and argv[0] in ("--version", "-V"):
+        print(VERSION)
+        return 0
+    if not argv or argv[0] not in ("compile", "c"):
+        print(f"fake typst: unsupported arguments {argv}", file=sys.stderr)
+        return 2
+
+    fmt = "pdf"
+    positional = []
+    args = iter(argv[1:])
+    for arg in args:
+        if arg in ("--format", "-f"):
+            fmt = next(args)
+        elif arg in ("--features", "--root", "--font-path", "--package-path", "--package-cache-path", "--input"):
+            next(args)
+        elif arg.startswith("--"):
+            continue
+        else:
+            positional.append(arg)
+
+    source_path, output = positional[0], positional[1] if len(positional) > 1 else None
+    source = sys.stdin.read() if source_path == "-" else open(source_path, encoding="utf-8").read()
+
+    if source.count("(") != source.count(")"):
+        print("error: unclosed delimiter", file=sys.stderr)
+        return 1
+
+    if fmt == "html":
+        result = typst_to_html(source)
+        if output in (None, "-"):
+            sys.stdout.write(result)
+        else:
+            open(output, "w", encoding="utf-8").write(result)
+    elif fmt == "svg":
+        # build.py's math batches emit two pages (math and depth probe) per #inline/#display call
+        math_calls = len(re.findall(r'^#(?:inline|display)\(', source, re.MULTILINE))
+        pages = 2 * math_calls if math_calls else max(1, source.count("#pagebreak()") + 1)
+        for page in range(1, pages + 1):
+            target = output.replace("{p}", str(page)).replace("{n}", str(page))
+            if target == "-":
+                sys.stdout.write(typst_to_svg(source, page))
+            else:
+                open(target, "w", encoding="utf-8").write(typst_to_svg(source, page))
+            if target == output:
+                break
+    else:
+        open(output, "wb").write(b"%PDF-1.7 fake\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
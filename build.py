@@ -1,16 +1,56 @@
+import argparse
+import gzip
+import hashlib
+import html as html_lib
+import http.client
+import importlib.metadata
+import io
+import json
 import os
 import shutil
 import subprocess
+import sys
+import queue
 import re
-from datetime import datetime
+import signal
+import socket
+import struct
+import tarfile
+import tempfile
+import threading
+import time
+import traceback
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from xml.sax.saxutils import XMLGenerator
+
+# Optional: only needed for .zst precompression
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Optional: Typst's Python bindings (typst-py), only needed for TYPST_IN_PROCESS
+try:
+    import typst
+except ImportError:
+    typst = None
 
 # Import configuration
 try:
     from build_config import (
     USE_SVG_FOR_BLOG, USE_TYPST_HTML_FOR_BLOG,
     USE_SVG_FOR_PAGES, USE_TYPST_HTML_FOR_PAGES,
-    BASE_URL
+    BASE_URL, MATH_RENDERER, PANDOC_SERVER, PANDOC_SERVER_CONCURRENCY, BLOG_PAGE_SIZE,
+    PRECOMPRESS_FORMATS, PRECOMPRESS_MIN_BYTES, COMPILE_CACHE_MAX_BYTES, BUILD_JOBS,
+    TOOL_TIMEOUT, TOOL_MEMORY_LIMIT, MAX_FAILURES, SLOW_TOOL_SECONDS, TYPST_IN_PROCESS,
+    INLINE_CRITICAL_CSS, PREFETCH_POSTS, SITE_URL, FEED_TITLE
 )
 except ImportError:
     # Defaults if config file doesn't exist
@@ -18,6 +58,24 @@ except ImportError:
     USE_SVG_FOR_PAGES = False
     USE_TYPST_HTML_FOR_BLOG = False
     USE_TYPST_HTML_FOR_PAGES = False
+    BASE_URL = ""
+    MATH_RENDERER = "mathjax"
+    PANDOC_SERVER = False
+    PANDOC_SERVER_CONCURRENCY = 4
+    BLOG_PAGE_SIZE = 10
+    PRECOMPRESS_FORMATS = ("gz", "zst")
+    PRECOMPRESS_MIN_BYTES = 1024
+    COMPILE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+    BUILD_JOBS = None
+    TOOL_TIMEOUT = 120
+    TOOL_MEMORY_LIMIT = 4 * 1024 * 1024 * 1024
+    MAX_FAILURES = None
+    SLOW_TOOL_SECONDS = 10
+    TYPST_IN_PROCESS = False
+    INLINE_CRITICAL_CSS = True
+    PREFETCH_POSTS = 3
+    SITE_URL = "https://arham-lodha.github.io"
+    FEED_TITLE = "Math Major"
 
 # Configuration
 CONTENT_DIR = Path("content")
@@ -26,15 +84,815 @@ PAGES_DIR = CONTENT_DIR / "pages"
 TEMPLATES_DIR = Path("templates")
 STATIC_DIR = Path("static")
 OUTPUT_DIR = Path("output")
+INTERACTIVE_DIR = Path("interactive")
+# Mounts lazily embedded interactive components
+INTERACTIVE_LOADER = "/static/js/interactive.js"
+CACHE_DIR = Path(".cache")
+# Written by `build.py vendor`: Typst packages and fonts compiles use exclusively once the lock exists
+VENDOR_DIR = Path("vendor")
+VENDOR_PACKAGES = VENDOR_DIR / "typst-packages"
+VENDOR_FONTS = VENDOR_DIR / "fonts"
+VENDOR_LOCK = VENDOR_DIR / "typst.lock.json"
+VENDOR_LOCK_VERSION = 1
+COMPILE_CACHE_DIR = CACHE_DIR / "compile"
+MATH_CACHE_DIR = CACHE_DIR / "math"
+BUILD_MANIFEST = CACHE_DIR / "build-manifest.json"
+BUILD_MANIFEST_VERSION = 1
+METADATA_INDEX = CACHE_DIR / "metadata-index.json"
+METADATA_INDEX_VERSION = 2
+# Metadata must appear in the first this-many bytes of a source
+MAX_PREAMBLE_BYTES = 16 * 1024
+SEARCH_DIR = "static/search"
+# Split a search shard by a longer term prefix once it holds more terms than this
+SEARCH_SHARD_MAX_TERMS = 2000
+SEARCH_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in is it its of on or that the this to was were will with we i you
+""".split())
+
+# Toggled off by --no-cache
+USE_COMPILE_CACHE = True
+
+# Source path -> {"size", "mtime_ns", "metadata"}, loaded lazily from METADATA_INDEX
+_metadata_index = None
+_metadata_index_dirty = False
+_metadata_lock = threading.Lock()
+
+# Compile failures are collected here and reported once the build finishes,
+# so output from parallel workers doesn't interleave
+_failures = []
+_failures_lock = threading.Lock()
+# Source file currently being compiled by this thread
+_current = threading.local()
+# Set once more compiles failed than MAX_FAILURES allows, stops every further tool run
+_aborted = threading.Event()
+# Tool processes currently running, killed when the build is aborted
+_running = set()
+_running_lock = threading.Lock()
+# (seconds, source, tool) for every tool run slower than SLOW_TOOL_SECONDS
+_slow_tools = []
+
+class BuildAborted(Exception):
+    """Raised once the build has used up its failure budget (MAX_FAILURES)."""
+
+class ToolTimeout(subprocess.CalledProcessError):
+    """
+    A tool run killed for outliving its timeout. It is a CalledProcessError so callers
+    record it like any other failed compile.
+    """
+
+# Build tracing, enabled by --trace. Spans are kept as Chrome trace events.
+TRACE_ENABLED = False
+_trace_events = []
+_trace_lock = threading.Lock()
+_trace_start = time.perf_counter()
+
+def _trace_timestamp():
+    return round((time.perf_counter() - _trace_start) * 1e6, 1)
+
+@contextmanager
+def span(name, category="stage", **args):
+    """
+    Records a trace span around a block. Yields the span's args dict so the block can
+    attach results (exit codes, sizes). The source file being built is attached automatically.
+    """
+    if not TRACE_ENABLED:
+        yield args
+        return
+    source = getattr(_current, "source", None)
+    if source is not None:
+        args.setdefault("file", str(source))
+    start = _trace_timestamp()
+    try:
+        yield args
+    finally:
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start,
+            "dur": round(_trace_timestamp() - start, 1),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        with _trace_lock:
+            _trace_events.append(event)
+
+def log(message):
+    """Prints a progress message, recording it in the trace as an instant event."""
+    print(message)
+    if TRACE_ENABLED:
+        event = {
+            "name": message.strip(),
+            "cat": "log",
+            "ph": "i",
+            "s": "t",
+            "ts": _trace_timestamp(),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        with _trace_lock:
+            _trace_events.append(event)
+
+def kill_process_group(process):
+    """Kills a tool and everything it spawned (run_tool starts each tool in its own group)."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def note_tool_time(name, seconds):
+    """Remembers a tool run slower than SLOW_TOOL_SECONDS for the build report."""
+    if SLOW_TOOL_SECONDS is not None and seconds >= SLOW_TOOL_SECONDS:
+        with _failures_lock:
+            _slow_tools.append((seconds, str(getattr(_current, "source", None) or "<unknown>"), name))
+
+def memory_limited(cmd):
+    """
+    `cmd` wrapped so it execs with its address space capped at TOOL_MEMORY_LIMIT bytes.
+    The limit has to be in place before exec: pandoc's runtime reserves its heap at
+    startup and fails later allocations if the cap arrives afterwards, and preexec_fn
+    isn't safe with worker threads, so a shell sets it and execs the tool.
+    """
+    if not TOOL_MEMORY_LIMIT or os.name != "posix":
+        return cmd
+    # ulimit -v takes KiB; if the hard limit is already lower the tool runs under that one
+    script = 'ulimit -v "$1" 2>/dev/null; shift; exec "$@"'
+    return ["/bin/sh", "-c", script, "sh", str(TOOL_MEMORY_LIMIT // 1024), *map(str, cmd)]
+
+def run_tool(cmd, input=None, text=False, capture_output=False, check=False, timeout=None, cwd=None):
+    """
+    Runs an external tool (typst, pandoc), like subprocess.run, with TOOL_TIMEOUT seconds
+    of wall time and TOOL_MEMORY_LIMIT bytes of address space. A run that times out is
+    killed with its whole process group and raises ToolTimeout. Traces argv, exit code and
+    output size, and remembers runs slower than SLOW_TOOL_SECONDS for the build report.
+    Raises BuildAborted instead of starting anything once the failure budget is used up.
+    """
+    if timeout is None:
+        timeout = TOOL_TIMEOUT
+    name = os.path.basename(str(cmd[0]))
+    if _aborted.is_set():
+        raise BuildAborted(f"not running {name}, the build was aborted")
+    
+    with span(name, category="subprocess", argv=[str(arg) for arg in cmd]) as info:
+        start = time.perf_counter()
+        pipe = subprocess.PIPE if capture_output else None
+        # A session of its own makes the tool a process group leader, so a timeout can
+        # take down anything it spawned too
+        process = subprocess.Popen(
+            memory_limited(cmd),
+            stdin=subprocess.PIPE if input is not None else None,
+            stdout=pipe,
+            stderr=pipe,
+            text=text,
+            cwd=cwd,
+            start_new_session=True
+        )
+        with _running_lock:
+            _running.add(process)
+        try:
+            try:
+                stdout, stderr = process.communicate(input, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                kill_process_group(process)
+                stdout, stderr = process.communicate()
+                info["timed_out"] = True
+                message = f"{name} timed out after {timeout}s and was killed\n"
+                raise ToolTimeout(process.returncode, cmd, stdout, message if text else message.encode("utf-8"))
+            except BaseException:
+                kill_process_group(process)
+                process.wait()
+                raise
+        finally:
+            with _running_lock:
+                _running.discard(process)
+            note_tool_time(name, time.perf_counter() - start)
+        
+        info["exit_code"] = process.returncode
+        info["stdout_bytes"] = len(stdout or "")
+        if process.returncode and _aborted.is_set():
+            # Killed because another compile used up the failure budget
+            raise BuildAborted(f"{name} was stopped, the build was aborted")
+        if check and process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+        return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+def write_trace(path):
+    """Writes the recorded spans as Chrome trace-event JSON (chrome://tracing, Perfetto)."""
+    with _trace_lock:
+        events = list(_trace_events)
+    
+    # Name threads so parallel workers are readable in the viewer
+    thread_ids = sorted({event["tid"] for event in events}, key=lambda tid: min(e["ts"] for e in events if e["tid"] == tid))
+    names = {tid: ("main" if index == 0 else f"worker-{index}") for index, tid in enumerate(thread_ids)}
+    metadata = [
+        {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+        for tid, name in names.items()
+    ]
+    
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+
+def print_trace_summary(limit=10):
+    """Prints per-stage totals, the slowest source files and subprocess counts."""
+    with _trace_lock:
+        events = [event for event in _trace_events if event["ph"] == "X"]
+    
+    stages = {}
+    files = {}
+    tools = {}
+    for event in events:
+        seconds = event["dur"] / 1e6
+        if event["cat"] == "subprocess":
+            count, total = tools.get(event["name"], (0, 0.0))
+            tools[event["name"]] = (count + 1, total + seconds)
+        else:
+            stages[event["name"]] = stages.get(event["name"], 0.0) + seconds
+        if event["name"] in ("build_post", "build_home"):
+            files[event["args"].get("file", "?")] = seconds
+    
+    print("\nStage totals (summed across threads):")
+    for name, seconds in sorted(stages.items(), key=lambda item: -item[1]):
+        print(f"  {name:<24}{seconds:>9.3f}s")
+    
+    if files:
+        print("\nSlowest files:")
+        for name, seconds in sorted(files.items(), key=lambda item: -item[1])[:limit]:
+            print(f"  {seconds:>9.3f}s  {name}")
+    
+    total_calls = sum(count for count, _ in tools.values())
+    print(f"\nSubprocesses: {total_calls}")
+    for name, (count, seconds) in sorted(tools.items()):
+        print(f"  {name:<12}{count:>6} calls {seconds:>9.3f}s")
+
+def record_failure(message, source=None):
+    """
+    Records a failed compile for the report at the end of the build. Once there are more
+    than MAX_FAILURES, the build is aborted: running tools are killed and no new ones start.
+    """
+    if source is None:
+        source = getattr(_current, "source", None)
+    with _failures_lock:
+        _failures.append((str(source or "<unknown>"), message.rstrip()))
+        over_budget = MAX_FAILURES is not None and len(_failures) > MAX_FAILURES
+    if over_budget and not _aborted.is_set():
+        _aborted.set()
+        with _running_lock:
+            running = list(_running)
+        for process in running:
+            kill_process_group(process)
+
+def check_failure_budget():
+    """Raises BuildAborted if the build used up its failure budget."""
+    if _aborted.is_set():
+        raise BuildAborted(f"more than {MAX_FAILURES} failure(s)")
+
+def report_failures():
+    """Prints every recorded failure grouped by source file. Returns the failure count."""
+    with _failures_lock:
+        failures = sorted(_failures, key=lambda failure: failure[0])
+        _failures.clear()
+    
+    if failures:
+        print(f"\n{len(failures)} failure(s):")
+        for source, message in failures:
+            print(f"--- {source}")
+            print(message)
+    return len(failures)
+
+def report_slow_tools(limit=10):
+    """Prints the slowest tool runs that took at least SLOW_TOOL_SECONDS."""
+    with _failures_lock:
+        slow = sorted(_slow_tools, reverse=True)
+        _slow_tools.clear()
+    
+    if slow:
+        print(f"\n{len(slow)} tool run(s) took {SLOW_TOOL_SECONDS}s or longer:")
+        for seconds, source, name in slow[:limit]:
+            print(f"  {seconds:>9.3f}s  {name:<8}{source}")
 
 def clean_output():
     if OUTPUT_DIR.exists():
         shutil.rmtree(OUTPUT_DIR)
     OUTPUT_DIR.mkdir()
 
-def copy_static():
-    if STATIC_DIR.exists():
-        shutil.copytree(STATIC_DIR, OUTPUT_DIR / "static")
+OUTPUT_MANIFEST = OUTPUT_DIR / ".manifest.json"
+OUTPUT_MANIFEST_VERSION = 1
+
+def load_output_manifest(source=OUTPUT_MANIFEST, missing_ok=True):
+    """
+    Reads the "files" mapping of an output manifest from a path or an http(s) URL
+    (e.g. the one on the deployed site). If it can't be read, returns {} with
+    `missing_ok` and exits with an error otherwise.
+    """
+    try:
+        if str(source).startswith(("http://", "https://")):
+            with urllib.request.urlopen(str(source), timeout=30) as response:
+                manifest = json.loads(response.read().decode("utf-8"))
+        else:
+            manifest = json.loads(Path(source).read_text(encoding="utf-8"))
+        if manifest.get("version") != OUTPUT_MANIFEST_VERSION:
+            raise ValueError(f"unsupported manifest version {manifest.get('version')!r}")
+    # URLError and HTTPError are OSErrors too
+    except (OSError, ValueError) as e:
+        if missing_ok:
+            return {}
+        raise SystemExit(f"Error: can't read output manifest {source}: {e}")
+    return manifest.get("files", {})
+
+def write_output_manifest(previous, annotations=None):
+    """
+    Writes output/.manifest.json, mapping every file in output/ to its size and SHA-256.
+    Files byte-identical to the ones listed in `previous` (the last build's manifest) get
+    their old mtime back, so even after a clean build rsync-style tools only see the
+    files that really changed. Hashes are reused for files whose size and mtime match.
+    `annotations` adds extra fields to some entries (see build_feeds).
+    """
+    annotations = annotations or {}
+    files = {}
+    for path in sorted(OUTPUT_DIR.rglob("*")):
+        if not path.is_file() or path == OUTPUT_MANIFEST:
+            continue
+        rel_path = path.relative_to(OUTPUT_DIR).as_posix()
+        stat = path.stat()
+        old = previous.get(rel_path)
+        if old and old["size"] == stat.st_size and old.get("mtime_ns") == stat.st_mtime_ns:
+            files[rel_path] = {"size": old["size"], "sha256": old["sha256"], "mtime_ns": old["mtime_ns"], **annotations.get(rel_path, {})}
+            continue
+        
+        sha256 = file_digest(path)
+        mtime_ns = stat.st_mtime_ns
+        if old and old["sha256"] == sha256 and "mtime_ns" in old:
+            mtime_ns = old["mtime_ns"]
+            os.utime(path, ns=(stat.st_atime_ns, mtime_ns))
+            with _digest_lock:
+                _digest_cache[path.as_posix()] = [stat.st_size, mtime_ns, sha256]
+        files[rel_path] = {"size": stat.st_size, "sha256": sha256, "mtime_ns": mtime_ns, **annotations.get(rel_path, {})}
+    
+    manifest = {"version": OUTPUT_MANIFEST_VERSION, "files": files}
+    atomic_write(OUTPUT_MANIFEST, json.dumps(manifest, indent=1))
+
+def diff_output_manifests(old, new):
+    """Returns sorted (added, changed, removed) paths between two manifests' "files" mappings."""
+    added = sorted(set(new) - set(old))
+    removed = sorted(set(old) - set(new))
+    changed = sorted(path for path in set(old) & set(new) if old[path]["sha256"] != new[path]["sha256"])
+    return added, changed, removed
+
+# Output path (relative to OUTPUT_DIR) -> {"inputs": {input: digest}, ...} from the previous build
+_previous_outputs = {}
+# The same mapping for the build in progress
+_current_outputs = {}
+# Outputs this build failed to regenerate: left as they are on disk, but not recorded,
+# so the next build tries again
+_kept_outputs = set()
+_outputs_lock = threading.Lock()
+# Input path -> [size, mtime_ns, sha256], so unchanged inputs are never re-read
+_digest_cache = {}
+_digest_lock = threading.Lock()
+_config_digest = None
+
+def load_build_manifest(clean=False):
+    """
+    Loads the dependency manifest written by the previous build.
+    Returns True if output/ can be updated incrementally, False if it needs a clean build.
+    """
+    global _previous_outputs, _config_digest
+    _current_outputs.clear()
+    _kept_outputs.clear()
+    _config_digest = None
+    
+    try:
+        manifest = json.loads(BUILD_MANIFEST.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    if manifest.get("version") != BUILD_MANIFEST_VERSION:
+        manifest = {}
+    
+    with _digest_lock:
+        _digest_cache.update(manifest.get("digests", {}))
+    _previous_outputs = {} if clean else manifest.get("outputs", {})
+    return bool(_previous_outputs) and OUTPUT_DIR.exists()
+
+def save_build_manifest():
+    # Only keep digests for files that are still inputs of something
+    used = {path for record in _current_outputs.values() for path in record["inputs"]}
+    manifest = {
+        "version": BUILD_MANIFEST_VERSION,
+        "outputs": dict(sorted(_current_outputs.items())),
+        "digests": {path: entry for path, entry in sorted(_digest_cache.items()) if path in used},
+    }
+    atomic_write(BUILD_MANIFEST, json.dumps(manifest, indent=1))
+
+def file_digest(path):
+    """SHA-256 of a file, memoized on (size, mtime) so unchanged files are only hashed once."""
+    key = Path(path).as_posix()
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return "<missing>"
+    
+    with _digest_lock:
+        cached = _digest_cache.get(key)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+    
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    with _digest_lock:
+        _digest_cache[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return digest.hexdigest()
+
+def config_digest():
+    """Digest of everything global that affects every page: the build script, its config and env."""
+    global _config_digest
+    if _config_digest is None:
+        digest = hashlib.sha256()
+        # The vendor lock pins the packages and fonts every compile sees
+        for path in (Path(__file__), Path("build_config.py"), VENDOR_LOCK):
+            digest.update(file_digest(path).encode("utf-8"))
+        # Upgrading typst or pandoc changes every page they compiled
+        for tool in ("typst", "pandoc"):
+            digest.update(tool_fingerprint(tool).encode("utf-8"))
+        if TYPST_IN_PROCESS and typst is not None:
+            digest.update(f"typst-py:{typst_py_version()}".encode("utf-8"))
+        digest.update(f"{BASE_URL}|{USE_SVG_FOR_BLOG}|{USE_TYPST_HTML_FOR_BLOG}|{USE_SVG_FOR_PAGES}|{USE_TYPST_HTML_FOR_PAGES}|{MATH_RENDERER}|{INLINE_CRITICAL_CSS}|{PREFETCH_POSTS}".encode("utf-8"))
+        _config_digest = digest.hexdigest()
+    return _config_digest
+
+def input_digests(paths, **values):
+    """
+    Builds the inputs mapping for an output: file paths map to their digests,
+    keyword arguments are extra non-file inputs (hashed if not already strings).
+    """
+    inputs = {"config": config_digest()}
+    for path in paths:
+        inputs[Path(path).as_posix()] = file_digest(path)
+    for name, value in values.items():
+        if not isinstance(value, str):
+            value = hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+        inputs[name] = value
+    return inputs
+
+def reuse_output(rel_path, inputs):
+    """
+    Returns the previous build's record for `rel_path` if it was produced from exactly
+    `inputs` and still exists, carrying it over into this build. Returns None otherwise.
+    """
+    previous = _previous_outputs.get(rel_path)
+    if not (previous and previous["inputs"] == inputs and (OUTPUT_DIR / rel_path).exists()):
+        return None
+    # Files the output links to (lazily loaded SVG pages) are carried over with it
+    resources = previous.get("resources", [])
+    if not all(res in _previous_outputs and (OUTPUT_DIR / res).exists() for res in resources):
+        return None
+    with _outputs_lock:
+        _current_outputs[rel_path] = previous
+        for res in resources:
+            _current_outputs[res] = _previous_outputs[res]
+    return previous
+
+def record_output(rel_path, inputs, **info):
+    with _outputs_lock:
+        _current_outputs[rel_path] = {"inputs": inputs, **info}
+
+def atomic_write(path, data):
+    """
+    Writes text to `path` through a temp file private to this process and thread, then
+    renames it into place, so concurrent readers and builds never see a partial file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    temp.write_text(data, encoding="utf-8")
+    os.replace(temp, path)
+
+def write_output(rel_path, content):
+    """Writes a generated file into output/, leaving it untouched if the content is identical."""
+    path = OUTPUT_DIR / rel_path
+    data = content.encode("utf-8")
+    try:
+        if path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return True
+
+def remove_stale_outputs():
+    """Deletes files produced by the previous build that this build no longer produces."""
+    stale = set(_previous_outputs) - set(_current_outputs) - _kept_outputs
+    for rel_path in sorted(stale):
+        path = OUTPUT_DIR / rel_path
+        path.unlink(missing_ok=True)
+        # Drop directories left empty, e.g. output/blog/<removed-post>/
+        parent = path.parent
+        while parent != OUTPUT_DIR and parent.exists() and not any(parent.iterdir()):
+            parent.rmdir()
+            parent = parent.parent
+    return len(stale)
+
+# Static files minified and served under content-hashed names
+FINGERPRINTED_SUFFIXES = (".css", ".js")
+# Source URL -> fingerprinted URL (e.g. /static/css/style.css -> /static/css/style.3fa9c1d2.css),
+# filled by build_assets and applied by fix_paths_stage
+_asset_urls = {}
+
+# Comments, quoted strings and everything in between, so minifiers never touch string contents
+_CSS_PIECE = re.compile(r'/\*.*?\*/|"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|[^/"\']+|.', re.DOTALL)
+
+def minify_css(css):
+    """Drops comments and collapses whitespace outside of strings."""
+    out = []
+    code = []
+    
+    def flush():
+        text = re.sub(r'\s+', ' ', "".join(code))
+        text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+        out.append(re.sub(r':\s+', ':', text).replace(";}", "}"))
+        code.clear()
+    
+    for piece in _CSS_PIECE.findall(css):
+        if piece.startswith("/*"):
+            # A comment still separates tokens
+            code.append(" ")
+        elif piece[0] in "\"'":
+            flush()
+            out.append(piece)
+        else:
+            code.append(piece)
+    flush()
+    return "".join(out).strip()
+
+def minify_js(js):
+    """
+    Strips indentation, blank lines and whole-line // comments. Line breaks are kept
+    (automatic semicolon insertion depends on them) and so are lines inside multi-line
+    template literals, whose whitespace is part of the string.
+    """
+    out = []
+    in_template = False
+    for line in js.splitlines():
+        if in_template:
+            out.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith("//"):
+                out.append(stripped)
+        # An odd number of unescaped backticks opens or closes a template literal
+        if len(re.findall(r'(?<!\\)`', line)) % 2:
+            in_template = not in_template
+    return "\n".join(out) + "\n"
+
+def asset_digest():
+    """Digest of the fingerprinted asset URLs, an input of every page that links to them."""
+    return hashlib.sha256(json.dumps(_asset_urls, sort_keys=True).encode("utf-8")).hexdigest()
+
+def build_assets():
+    """
+    Writes static/ into output/static/. CSS and JS are minified and written under
+    content-hashed names, so they can be served with immutable caching; other files are
+    copied as-is. Files whose source is unchanged since the last build are skipped.
+    """
+    _asset_urls.clear()
+    if not STATIC_DIR.exists():
+        return
+    previous_assets = {record["source"]: rel_path for rel_path, record in _previous_outputs.items() if "source" in record}
+    
+    for src in sorted(STATIC_DIR.rglob("*")):
+        if not src.is_file():
+            continue
+        rel_path = (Path("static") / src.relative_to(STATIC_DIR)).as_posix()
+        inputs = input_digests([src])
+        
+        if src.suffix not in FINGERPRINTED_SUFFIXES:
+            if reuse_output(rel_path, inputs):
+                continue
+            dest = OUTPUT_DIR / rel_path
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(src, dest)
+            record_output(rel_path, inputs)
+            continue
+        
+        hashed_path = previous_assets.get(src.as_posix())
+        if not (hashed_path and reuse_output(hashed_path, inputs)):
+            text = src.read_text(encoding="utf-8")
+            minified = minify_css(text) if src.suffix == ".css" else minify_js(text)
+            fingerprint = hashlib.sha256(minified.encode("utf-8")).hexdigest()[:8]
+            hashed_path = f"{rel_path[:-len(src.suffix)]}.{fingerprint}{src.suffix}"
+            write_output(hashed_path, minified)
+            record_output(hashed_path, inputs, source=src.as_posix())
+        _asset_urls[f"/{rel_path}"] = f"/{hashed_path}"
+
+# Output types the static host can serve precompressed
+PRECOMPRESS_SUFFIXES = (".html", ".css", ".js", ".json", ".svg", ".xml")
+GZIP_LEVEL = 9
+ZSTD_LEVEL = 19
+_warned_no_zstd = False
+
+def compress_file(path, formats):
+    """
+    Writes compressed siblings of `path` (path.gz, path.zst) for `formats`. Runs in a
+    worker process. Returns {format: compressed size}.
+    """
+    data = Path(path).read_bytes()
+    sizes = {}
+    for fmt in formats:
+        if fmt == "gz":
+            # mtime=0 keeps the output byte-identical across builds
+            compressed = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+        else:
+            compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+        Path(f"{path}.{fmt}").write_bytes(compressed)
+        sizes[fmt] = len(compressed)
+    return sizes
+
+def precompress_outputs(jobs=None):
+    """
+    Writes .gz/.zst siblings for every text output of at least PRECOMPRESS_MIN_BYTES,
+    using a pool of worker processes. Each sibling is recorded in the build manifest with
+    the content hash of its source, its size and compression ratio, so files whose
+    content hasn't changed are skipped on the next build.
+    """
+    global _warned_no_zstd
+    formats = [fmt for fmt in PRECOMPRESS_FORMATS if fmt == "gz" or (fmt == "zst" and zstandard)]
+    if "zst" in PRECOMPRESS_FORMATS and not zstandard and not _warned_no_zstd:
+        log("Warning: zstandard is not installed, skipping .zst precompression")
+        _warned_no_zstd = True
+    if not formats:
+        return
+    
+    pending = {}
+    for rel_path in sorted(_current_outputs):
+        path = OUTPUT_DIR / rel_path
+        if not rel_path.endswith(PRECOMPRESS_SUFFIXES) or path.stat().st_size < PRECOMPRESS_MIN_BYTES:
+            continue
+        # The output's own path as key keeps its digest memoized in the manifest
+        source = {path.as_posix(): file_digest(path)}
+        stale = []
+        for fmt in formats:
+            level = GZIP_LEVEL if fmt == "gz" else ZSTD_LEVEL
+            if not reuse_output(f"{rel_path}.{fmt}", {**source, "level": f"{fmt}-{level}"}):
+                stale.append(fmt)
+        if stale:
+            pending[rel_path] = (source, stale)
+    
+    if not pending:
+        return
+    log(f"Compressing {len(pending)} file(s)")
+    workers = min(jobs or BUILD_JOBS or os.cpu_count() or 1, len(pending))
+    with span("compress", files=len(pending), workers=workers):
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                rel_path: pool.submit(compress_file, str(OUTPUT_DIR / rel_path), stale)
+                for rel_path, (source, stale) in pending.items()
+            }
+            for rel_path, future in futures.items():
+                source, stale = pending[rel_path]
+                size = (OUTPUT_DIR / rel_path).stat().st_size
+                for fmt, compressed_size in future.result().items():
+                    level = GZIP_LEVEL if fmt == "gz" else ZSTD_LEVEL
+                    record_output(
+                        f"{rel_path}.{fmt}", {**source, "level": f"{fmt}-{level}"},
+                        size=compressed_size, ratio=round(compressed_size / size, 4)
+                    )
+
+# The `pandoc server` process shared by the whole build, started on first use if
+# PANDOC_SERVER is enabled (see pandoc_server_running)
+_pandoc_server = None
+_pandoc_server_attempted = False
+_pandoc_server_lock = threading.Lock()
+# Idle keep-alive connections to it, and a cap on requests in flight
+_pandoc_connections = queue.LifoQueue()
+_pandoc_slots = None
+
+def start_pandoc_server(timeout=5.0):
+    """
+    Starts one long-lived `pandoc server` on a free local port for this build.
+    Returns False (and leaves run_pandoc on the CLI) if the server doesn't come up.
+    """
+    global _pandoc_server, _pandoc_slots
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    
+    with span("start_pandoc_server", port=port) as info:
+        try:
+            process = subprocess.Popen(
+                # The server enforces TOOL_TIMEOUT per request itself
+                ["pandoc", "server", "--port", str(port), "--timeout", str(TOOL_TIMEOUT or 120)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
+            )
+        except OSError as e:
+            log(f"Warning: pandoc server unavailable ({e}), using the pandoc CLI")
+            return False
+        
+        _pandoc_server = (process, port)
+        _pandoc_slots = threading.BoundedSemaphore(max(1, PANDOC_SERVER_CONCURRENCY))
+        deadline = time.monotonic() + timeout
+        while process.poll() is None and time.monotonic() < deadline:
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                connection.request("GET", "/version")
+                if connection.getresponse().status == 200:
+                    connection.close()
+                    info["ready"] = True
+                    return True
+            except OSError:
+                time.sleep(0.05)
+        
+        stderr = process.stderr.read().decode("utf-8", errors="replace").strip() if process.poll() is not None else "timed out"
+        log(f"Warning: pandoc server failed to start ({stderr.splitlines()[-1] if stderr else 'no output'}), using the pandoc CLI")
+        stop_pandoc_server()
+        return False
+
+def pandoc_server_running():
+    """Starts the pandoc server the first time it's needed in a build. Returns whether it's up."""
+    global _pandoc_server_attempted
+    if not PANDOC_SERVER:
+        return False
+    with _pandoc_server_lock:
+        if not _pandoc_server_attempted:
+            _pandoc_server_attempted = True
+            start_pandoc_server()
+    return _pandoc_server is not None
+
+def stop_pandoc_server():
+    # _pandoc_server_attempted stays set: after a failed start the rest of the build uses the CLI
+    global _pandoc_server
+    while not _pandoc_connections.empty():
+        _pandoc_connections.get_nowait().close()
+    if _pandoc_server:
+        process, _ = _pandoc_server
+        _pandoc_server = None
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        process.stderr.close()
+
+def pandoc_server_request(payload):
+    """
+    Sends one conversion to the pandoc server over a pooled keep-alive connection.
+    Returns the output text, raises subprocess.CalledProcessError if pandoc rejected
+    the input and OSError/HTTPException if the server couldn't be reached.
+    """
+    _, port = _pandoc_server
+    body = json.dumps(payload).encode("utf-8")
+    with _pandoc_slots, span("pandoc", category="pandoc_server", to=payload["to"], bytes=len(body)):
+        try:
+            connection = _pandoc_connections.get_nowait()
+        except queue.Empty:
+            # A little longer than the server's own timeout, so its error wins the race
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=(TOOL_TIMEOUT or 120) + 5)
+        try:
+            connection.request("POST", "/", body, {"Content-Type": "application/json", "Accept": "application/json"})
+            response = connection.getresponse()
+            data = response.read().decode("utf-8")
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            raise
+        _pandoc_connections.put(connection)
+    
+    try:
+        result = json.loads(data)
+    except ValueError:
+        # Errors come back as plain text
+        result = {"error": data}
+    if response.status != 200 or "error" in result:
+        raise subprocess.CalledProcessError(1, ["pandoc", "server"], stderr=result.get("error", data))
+    if result.get("base64"):
+        raise subprocess.CalledProcessError(1, ["pandoc", "server"], stderr=f"unexpected binary output for {payload['to']}")
+    return result["output"]
+
+def run_pandoc(text, to, mathjax=False, relative_to=None):
+    """
+    Converts Typst source `text` with pandoc and returns the output. Goes through the
+    pandoc server when one is running, falling back to the CLI if it can't be reached.
+    Sources with local #import/#include need to be resolved relative to their file,
+    which only the CLI can do (run in that file's directory): pass the file as `relative_to`.
+    Raises subprocess.CalledProcessError if the conversion fails.
+    """
+    if relative_to is None and pandoc_server_running():
+        payload = {"text": text, "from": "typst", "to": to}
+        if mathjax:
+            payload["html-math-method"] = "mathjax"
+        try:
+            return pandoc_server_request(payload)
+        except (OSError, http.client.HTTPException) as e:
+            log(f"Warning: pandoc server request failed ({e}), using the pandoc CLI")
+    
+    cmd = ["pandoc", "-f", "typst", "-t", to]
+    if mathjax:
+        cmd.append("--mathjax")
+    # pandoc resolves imports in stdin input against its working directory, so nothing
+    # is written next to the sources
+    cwd = relative_to.parent if relative_to is not None else None
+    return run_tool(cmd, input=text, text=True, capture_output=True, check=True, cwd=cwd).stdout
 
 def compile_math_to_latex(math_content):
     """Converts Typst math to LaTeX using Pandoc."""
@@ -51,51 +909,592 @@ def compile_math_to_latex(math_content):
     
     try:
         # echo "$...$" | pandoc -f typst -t latex
-        result = subprocess.run(
-            ["pandoc", "-f", "typst", "-t", "latex"],
-            input=typ_source,
-            text=True,
-            capture_output=True,
-            check=True
-        )
-        return result.stdout.strip()
+        return run_pandoc(typ_source, "latex").strip()
     except subprocess.CalledProcessError as e:
-        print(f"Error converting math to LaTeX: {math_content}")
-        print(e.stderr)
+        record_failure(f"Error converting math to LaTeX: {math_content}\n{e.stderr}")
+        return None
+
+# Paragraph inserted between expressions in a batched pandoc call
+MATH_BATCH_SEPARATOR = "MATHBATCHSEPARATOR"
+
+# Typst math source -> LaTeX, shared by every document in a build
+_math_memo = {}
+_math_memo_lock = threading.Lock()
+
+def compile_math_batch(expressions):
+    """
+    Converts a list of Typst math expressions to LaTeX with a single Pandoc call.
+    Expressions are sent as separate paragraphs divided by a sentinel paragraph and
+    split apart again afterwards. Returns a list of LaTeX strings aligned with
+    `expressions`, or None if the batch output can't be split safely.
+    """
+    separator = MATH_BATCH_SEPARATOR
+    while any(separator in expr for expr in expressions):
+        separator += "X"
+    
+    typ_source = f"\n\n{separator}\n\n".join(f"${expr}$" for expr in expressions)
+    
+    try:
+        latex = run_pandoc(typ_source, "latex")
+    except subprocess.CalledProcessError:
+        # A single bad expression fails the whole batch
+        return None
+    
+    parts = [part.strip() for part in re.split(rf'^[ \t]*{separator}[ \t]*$', latex, flags=re.MULTILINE)]
+    if len(parts) != len(expressions) or not all(parts):
+        return None
+    return parts
+
+def convert_math_expressions(expressions):
+    """
+    Converts Typst math expressions to LaTeX, consulting the cross-document memo first.
+    All expressions missing from the memo are converted in one batched Pandoc call,
+    falling back to one call per expression only if the batch can't be split.
+    Returns a dict mapping each expression to its LaTeX (None if conversion failed).
+    """
+    with _math_memo_lock:
+        converted = {expr: _math_memo[expr] for expr in expressions if expr in _math_memo}
+    pending = list(dict.fromkeys(expr for expr in expressions if expr not in converted))
+    
+    if pending:
+        log(f"Converting {len(pending)} math expression(s)")
+        latex_list = compile_math_batch(pending)
+        if latex_list is None:
+            latex_list = [compile_math_to_latex(expr) for expr in pending]
+        
+        fresh = dict(zip(pending, latex_list))
+        with _math_memo_lock:
+            # Failures are left out of the memo so they get retried
+            _math_memo.update((expr, latex) for expr, latex in fresh.items() if latex)
+        converted.update(fresh)
+    
+    return converted
+
+# Prepended to every batch of math rendered to SVG. inline() also emits a probe page
+# whose height is the expression's depth below the baseline, so inline SVGs can be
+# aligned with the surrounding text.
+MATH_SVG_PREAMBLE = """#set page(width: auto, height: auto, margin: 0pt, fill: none)
+#let edges(bottom, body) = text(top-edge: "bounds", bottom-edge: bottom, body)
+#let inline(eq) = context {
+  let full = measure(edges("bounds", eq)).height
+  let above = measure(edges("baseline", eq)).height
+  edges("bounds", eq)
+  pagebreak()
+  box(width: 1pt, height: full - above)
+}
+#let display(eq) = {
+  eq
+  pagebreak()
+  box(width: 1pt, height: 0pt)
+}
+"""
+# Typst's default text size, em sizes keep rendered math in scale with the page font
+MATH_SVG_FONT_PT = 11
+
+_SVG_SIZE = re.compile(r'viewBox="[\d.\s-]+ ([\d.]+) ([\d.]+)"')
+
+def is_display_math(expr):
+    # In Typst, $ x $ (spaces inside both dollars) is a block equation, $x$ is inline
+    return expr[:1].isspace() and expr[-1:].isspace()
+
+def math_svg_markup(expr, svg, depth):
+    """
+    Turns the SVG Typst rendered for `expr` into inline markup: sized in em, glyphs
+    drawn in the text color, IDs made unique to the expression (several expressions
+    share a page) and the Typst source kept as the accessible label.
+    """
+    width, height = (float(value) / MATH_SVG_FONT_PT for value in _SVG_SIZE.search(svg).groups())
+    prefix = "m" + hashlib.sha256(expr.encode("utf-8")).hexdigest()[:8] + "-"
+    svg = re.sub(r'>\s+<', '><', svg[svg.index("<svg"):].strip())
+    svg = svg.replace('id="', f'id="{prefix}').replace('href="#', f'href="#{prefix}').replace("url(#", f"url(#{prefix}")
+    svg = svg.replace('fill="#000000"', 'fill="currentColor"').replace('stroke="#000000"', 'stroke="currentColor"')
+    label = html_lib.escape(expr.strip(), quote=True)
+    svg = re.sub(
+        r'<svg class="typst-doc" (viewBox="[^"]*") width="[^"]*" height="[^"]*"',
+        lambda match: f'<svg class="math-svg" role="img" aria-label="{label}" {match.group(1)} width="{width:.3f}em" height="{height:.3f}em"',
+        svg, count=1
+    )
+    if is_display_math(expr):
+        return f'<span class="math-display">{svg}</span>'
+    return f'<span class="math-inline" style="vertical-align: -{depth / MATH_SVG_FONT_PT:.3f}em">{svg}</span>'
+
+def read_svg_pages(directory):
+    """Reads the page-1.svg, page-2.svg, ... files `typst compile` wrote into `directory`."""
+    pages = []
+    while (directory / f"page-{len(pages) + 1}.svg").exists():
+        pages.append((directory / f"page-{len(pages) + 1}.svg").read_text(encoding="utf-8"))
+    return pages
+
+# Compiled by both backends before the in-process one is trusted with a build
+TYPST_PROBE_SOURCE = """= Probe
+Text with _emphasis_, `code`, a #link("https://typst.app")[link] and math $sum_(i=1)^n i^2$.
+
+- A list
+- #strong[Bold] item
+
+$ integral_0^1 x dif x = 1/2 $
+"""
+
+# None until the first compile of the process decides which backend to use
+_typst_in_process_ok = None
+_typst_backend_lock = threading.Lock()
+
+def typst_py_version():
+    try:
+        return importlib.metadata.version("typst")
+    except importlib.metadata.PackageNotFoundError:
+        return getattr(typst, "__version__", "unknown")
+
+def typst_in_process_available():
+    """
+    Whether compiles can use the in-process compiler: TYPST_IN_PROCESS is set, typst-py
+    is installed and its HTML and SVG output for a probe document is byte-identical to
+    the CLI's. Checked once per process, otherwise the CLI is used.
+    """
+    global _typst_in_process_ok
+    if not TYPST_IN_PROCESS:
+        return False
+    with _typst_backend_lock:
+        if _typst_in_process_ok is None:
+            _typst_in_process_ok = False
+            if typst is None:
+                log("Warning: TYPST_IN_PROCESS is set but typst-py isn't installed, using the typst CLI")
+                return False
+            if read_vendor_lock().get("packages"):
+                # typst-py has no option to point it at vendor/typst-packages
+                log("Note: vendored Typst packages need the typst CLI, not compiling in-process")
+                return False
+            with span("probe_typst_backends"):
+                try:
+                    for fmt in ("html", "svg"):
+                        cli = _typst_cli(TYPST_PROBE_SOURCE, fmt, Path.cwd())
+                        if _typst_in_process(TYPST_PROBE_SOURCE, fmt, Path.cwd()) != cli:
+                            log(f"Warning: in-process typst {fmt} output differs from the typst CLI, using the CLI")
+                            return False
+                except (subprocess.CalledProcessError, OSError) as e:
+                    log(f"Warning: could not compare the typst backends ({e}), using the typst CLI")
+                    return False
+            _typst_in_process_ok = True
+    return _typst_in_process_ok
+
+def typst_vendor_args():
+    """
+    `typst compile` options restricting packages and fonts to the vendored ones, once
+    `build.py vendor` has run. Fonts built into typst stay available either way.
+    """
+    if not VENDOR_LOCK.exists():
+        return []
+    packages = str(VENDOR_PACKAGES.resolve())
+    return [
+        "--package-path", packages,
+        "--package-cache-path", packages,
+        "--font-path", str(VENDOR_FONTS.resolve()),
+        "--ignore-system-fonts",
+    ]
+
+def _typst_cli(source, fmt, root):
+    """Compiles with `typst compile`, one process per call."""
+    cmd = ["typst", "compile", "--format", fmt, "--root", str(root), *typst_vendor_args()]
+    if fmt == "html":
+        cmd[2:2] = ["--features", "html"]
+    # Sources given as text are read from stdin, resolving imports against `root`
+    input_arg = "-" if isinstance(source, str) else str(source)
+    stdin = source if isinstance(source, str) else None
+    if fmt == "html":
+        return [run_tool(cmd + [input_arg, "-"], input=stdin, capture_output=True, text=True, check=True).stdout]
+    # One SVG per page, written to a private directory so parallel builds never
+    # share files and nothing is left in the content tree
+    with tempfile.TemporaryDirectory(prefix="typst-") as tmp:
+        tmp = Path(tmp)
+        run_tool(cmd + [input_arg, str(tmp / "page-{p}.svg")], input=stdin, capture_output=True, text=True, check=True)
+        return read_svg_pages(tmp)
+
+def _typst_in_process(source, fmt, root):
+    """
+    Compiles with typst-py. A Compiler never notices edited files, so each compile gets
+    a fresh one; typst's memoization is process-wide, which keeps parsed imports, layout
+    results and loaded packages warm across every document in the build.
+    """
+    options = {}
+    if VENDOR_LOCK.exists():
+        options = {"font_paths": [str(VENDOR_FONTS.resolve())], "ignore_system_fonts": True}
+    compiler = typst.Compiler(source.encode("utf-8") if isinstance(source, str) else str(source), root=str(root), **options)
+    try:
+        output = compiler.compile(format=fmt)
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except BaseException as e:
+        # Some compile errors surface as a Rust panic (pyo3's PanicException is a BaseException)
+        raise subprocess.CalledProcessError(1, ["typst", "compile", "--format", fmt], stderr=str(e))
+    pages = output if isinstance(output, list) else [output]
+    return [page.decode("utf-8") for page in pages]
+
+def compile_typst_source(source, fmt, root):
+    """
+    Compiles Typst `source` (a file path, or source text resolved against `root`) to
+    "html" or "svg" and returns the output pages (a single page for HTML). Runs in-process
+    when typst_in_process_available(), with the same timeout as a CLI run, otherwise
+    spawns the typst CLI. Raises subprocess.CalledProcessError if the compile fails.
+    """
+    if not typst_in_process_available():
+        return _typst_cli(source, fmt, root)
+    if _aborted.is_set():
+        raise BuildAborted("not compiling, the build was aborted")
+    
+    result = {}
+    def target():
+        try:
+            result["pages"] = _typst_in_process(source, fmt, root)
+        except BaseException as e:
+            result["error"] = e
+    
+    with span("typst", category="in_process", format=fmt) as info:
+        start = time.perf_counter()
+        # A daemon thread, so a runaway compile can be abandoned (it can't be killed
+        # in-process) without keeping the build from exiting
+        worker = threading.Thread(target=target, daemon=True)
+        worker.start()
+        worker.join(TOOL_TIMEOUT)
+        note_tool_time("typst", time.perf_counter() - start)
+        if worker.is_alive():
+            info["timed_out"] = True
+            raise ToolTimeout(-1, ["typst"], None, f"typst timed out after {TOOL_TIMEOUT}s and was abandoned\n")
+    if "error" in result:
+        raise result["error"]
+    return result["pages"]
+
+def render_math_batch(expressions):
+    """
+    Renders Typst math expressions to SVG with a single typst call, two pages per
+    expression (the math and its depth probe). Returns a list of markup strings
+    aligned with `expressions`, or None if the batch failed.
+    """
+    calls = [f"#{'display' if is_display_math(expr) else 'inline'}(${expr}$)" for expr in expressions]
+    source = MATH_SVG_PREAMBLE + "\n#pagebreak()\n".join(calls) + "\n"
+    
+    try:
+        pages = compile_typst_source(source, "svg", Path.cwd())
+    except subprocess.CalledProcessError:
+        # A single bad expression fails the whole batch
+        return None
+    
+    if len(pages) != 2 * len(expressions):
         return None
+    markup = []
+    for i, expr in enumerate(expressions):
+        depth = float(_SVG_SIZE.search(pages[2 * i + 1]).group(2))
+        markup.append(math_svg_markup(expr, pages[2 * i], depth))
+    return markup
+
+def math_svg_cache_path(expr):
+    key = hashlib.sha256(f"{tool_fingerprint('typst')}\0{file_digest(VENDOR_LOCK)}\0{MATH_SVG_PREAMBLE}\0{expr}".encode("utf-8")).hexdigest()
+    return MATH_CACHE_DIR / f"{key}.html"
+
+def render_math_svgs(expressions):
+    """
+    Renders Typst math expressions to inline SVG markup. Each distinct expression is
+    rendered once across all posts and builds: results are cached on disk under
+    .cache/math/, keyed by the expression and the typst binary. Everything missing
+    from the cache is rendered in one batch, falling back to one call per expression
+    if the batch fails. Returns a dict mapping each expression to its markup (None if
+    it couldn't be rendered). With --no-cache everything is rendered again and the
+    cached entries are replaced.
+    """
+    rendered = {}
+    pending = []
+    for expr in dict.fromkeys(expressions):
+        if not USE_COMPILE_CACHE:
+            pending.append(expr)
+            continue
+        path = math_svg_cache_path(expr)
+        try:
+            rendered[expr] = path.read_text(encoding="utf-8")
+            # Touch the entry so eviction is least-recently-used
+            os.utime(path)
+        except FileNotFoundError:
+            pending.append(expr)
+    
+    if pending:
+        log(f"Rendering {len(pending)} math expression(s) to SVG")
+        with span("render_math_svgs", expressions=len(pending)):
+            markup = render_math_batch(pending)
+            if markup is None:
+                markup = [(render_math_batch([expr]) or [None])[0] for expr in pending]
+        
+        for expr, svg in zip(pending, markup):
+            rendered[expr] = svg
+            if svg is None:
+                log(f"Warning: could not render math to SVG, falling back to MathJax: {expr}")
+                continue
+            atomic_write(math_svg_cache_path(expr), svg)
+    
+    return rendered
+
+def needs_mathjax(html):
+    """Whether compiled HTML still contains TeX math (pandoc output or SVG fallbacks)."""
+    return "\\(" in html or "\\[" in html
 
 def process_math(typ_content):
     """
-    Extracts math expressions, converts them to LaTeX, and replaces them with placeholders.
-    Returns modified content and a mapping of placeholders to LaTeX content.
+    Extracts math expressions, renders them (to SVG when MATH_RENDERER is "svg", otherwise
+    or on failure to LaTeX for MathJax), and replaces them with placeholders.
+    Returns modified content and a mapping of placeholders to the rendered math.
     """
     math_map = {}
     counter = 0
     
+    # Regex for math: $...$
+    # Simple regex: \$([^$]+)\$ (non-greedy?)
+    pattern = r'\$([^$]+)\$'
+    
+    expressions = [match.group(1) for match in re.finditer(pattern, typ_content)]
+    with span("process_math", expressions=len(expressions)):
+        rendered = render_math_svgs(expressions) if expressions and MATH_RENDERER == "svg" else {}
+        leftover = [expr for expr in expressions if not rendered.get(expr)]
+        if leftover:
+            rendered.update(convert_math_expressions(leftover))
+    
     def replace_math(match):
         nonlocal counter
-        math_content = match.group(1)
-        
-        print(f"Converting math: {math_content.strip()}")
-        latex = compile_math_to_latex(math_content)
+        math_html = rendered.get(match.group(1))
         
-        if latex:
+        if math_html:
             placeholder = f"__MATH_{counter}__"
-            math_map[placeholder] = latex
+            math_map[placeholder] = math_html
             counter += 1
             # Use raw block to prevent Typst from formatting underscores
             return f"`{placeholder}`"
         return match.group(0) # Return original if conversion fails
-
-    # Regex for math: $...$
-    # Simple regex: \$([^$]+)\$ (non-greedy?)
-    pattern = r'\$([^$]+)\$'
     
     processed_content = re.sub(pattern, replace_math, typ_content)
     return processed_content, math_map
 
-def compile_typst(typ_file, use_svg=False, use_typst_html=False, skip_toc=False):
-    """Compiles a Typst file to HTML (via Pandoc, Typst HTML, or SVG)."""
+def tool_fingerprint(tool):
+    """
+    Identifies the installed binary for `tool` without spawning it.
+    The resolved path, size and mtime change whenever the tool is upgraded.
+    """
+    path = shutil.which(tool)
+    if not path:
+        return f"{tool}:missing"
+    stat = os.stat(path)
+    return f"{tool}:{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def source_dependencies(typ_file, text=None):
+    """Files a Typst source pulls in: interactive components and local imports/includes."""
+    if text is None:
+        text = typ_file.read_text(encoding="utf-8")
+    deps = []
+    # Interactive components get inlined into the page
+    for name in sorted(set(re.findall(r'\[INTERACTIVE:([a-zA-Z0-9_/-]+)\]', text))):
+        deps.append(INTERACTIVE_DIR / f"{name}.html")
+    # Local imports/includes (packages like @preview/... are covered by the typst version)
+    for name in sorted(set(re.findall(r'#(?:import|include)\s+"([^"@][^"]*)"', text))):
+        deps.append(typ_file.parent / name)
+    return deps
+
+def source_inputs(typ_file, rel_path, templates, **values):
+    """
+    Inputs of a page compiled from `typ_file`: the source, the files it pulls in, the templates
+    and any extra `values`. The dependency list is reused from the previous build while the
+    source is unchanged.
+    """
+    typ_key = typ_file.as_posix()
+    typ_digest = file_digest(typ_file)
+    previous = _previous_outputs.get(rel_path)
+    if previous and previous["inputs"].get(typ_key) == typ_digest and "deps" in previous:
+        deps = [Path(dep) for dep in previous["deps"]]
+    else:
+        deps = source_dependencies(typ_file)
+    
+    inputs = input_digests([typ_file, *deps, *(TEMPLATES_DIR / name for name in templates)], assets=asset_digest(), **values)
+    return inputs, [dep.as_posix() for dep in deps]
+
+def compile_cache_key(typ_file, use_svg, use_typst_html, skip_toc, promote_headings=False):
+    """Hashes everything that can influence the output of compile_typst."""
+    source = typ_file.read_bytes()
+    digest = hashlib.sha256()
+    
+    def feed(label, data):
+        digest.update(label.encode("utf-8") + b"\0" + data + b"\0")
+    
+    feed("path", str(typ_file).encode("utf-8"))
+    feed("source", source)
+    feed("mode", f"svg={use_svg};typst_html={use_typst_html};skip_toc={skip_toc};promote={promote_headings};math={MATH_RENDERER}".encode("utf-8"))
+    feed("base_url", BASE_URL.encode("utf-8"))
+    
+    deps = [
+        TEMPLATES_DIR / "post.html",
+        TEMPLATES_DIR / "base.html",
+    ]
+    source_deps = source_dependencies(typ_file, source.decode("utf-8", errors="replace"))
+    deps.extend(source_deps)
+    
+    # Links to static CSS/JS in the content itself are rewritten to their fingerprinted
+    # names during compilation (the templates' links are rewritten at render time)
+    content = b"".join([source, *(dep.read_bytes() for dep in source_deps if dep.is_file())])
+    referenced = {url for url in _asset_urls if url.encode("utf-8") in content}
+    if b"[INTERACTIVE" in content:
+        # interactive_stage links the component loader
+        referenced.add(INTERACTIVE_LOADER)
+    if use_svg:
+        # Multi-page SVG documents link the page loader
+        referenced.add(TYPST_SVG_LOADER)
+    for url in sorted(referenced):
+        feed("asset", f"{url}={_asset_urls.get(url, url)}".encode("utf-8"))
+    
+    for dep in deps:
+        feed(str(dep), dep.read_bytes() if dep.is_file() else b"<missing>")
+    
+    for tool in ("typst", "pandoc"):
+        feed(tool, tool_fingerprint(tool).encode("utf-8"))
+    feed("vendor", file_digest(VENDOR_LOCK).encode("utf-8"))
+    
+    return digest.hexdigest()
+
+def read_compile_cache(key):
+    """Returns cached compile_typst output for `key`, or None on a miss."""
+    entry = COMPILE_CACHE_DIR / f"{key}.html"
+    try:
+        html = entry.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    # SVG pages the entry links to are cached next to it, a hit needs all of them
+    for name in set(_TYPST_SVG_RESOURCE.findall(html)):
+        resource = COMPILE_CACHE_DIR / name
+        if not resource.exists():
+            return None
+        os.utime(resource)
+    # Touch the entry so eviction is least-recently-used
+    os.utime(entry)
+    return html
+
+def write_compile_cache(key, html):
+    atomic_write(COMPILE_CACHE_DIR / f"{key}.html", html)
+
+def prune_compile_cache(max_bytes=None):
+    """
+    Evicts least recently used entries of the compile and math caches until together
+    they fit in `max_bytes`.
+    """
+    if max_bytes is None:
+        max_bytes = COMPILE_CACHE_MAX_BYTES
+    
+    entries = []
+    total = 0
+    for cache_dir in (COMPILE_CACHE_DIR, MATH_CACHE_DIR):
+        if not cache_dir.exists():
+            continue
+        for entry in cache_dir.iterdir():
+            if entry.suffix == ".tmp":
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry))
+            total += stat.st_size
+    
+    entries.sort()
+    for _, size, entry in entries:
+        if total <= max_bytes:
+            break
+        entry.unlink(missing_ok=True)
+        total -= size
+
+# Multi-page SVG documents only inline their first page. The later pages, and the glyphs
+# they use that the first page doesn't define, are stored in the compile cache under
+# content-hashed names, published to output/static/typst/ and fetched by this loader
+TYPST_SVG_LOADER = "/static/js/typst-pages.js"
+TYPST_SVG_URL = "/static/typst/"
+_TYPST_SVG_RESOURCE = re.compile(r'/static/typst/([0-9a-f]{16}\.svg)')
+_GLYPH_DEFS = re.compile(r'<defs id="glyph">(.*?)</defs>', re.DOTALL)
+_GLYPH_SYMBOL = re.compile(r'<symbol id="([^"]+)".*?</symbol>', re.DOTALL)
+
+def store_svg_resource(svg):
+    """Stores an SVG in the compile cache under its content hash and returns its URL."""
+    name = hashlib.sha256(svg.encode("utf-8")).hexdigest()[:16] + ".svg"
+    entry = COMPILE_CACHE_DIR / name
+    if not entry.exists():
+        atomic_write(entry, svg)
+    return fix_url(TYPST_SVG_URL + name)
+
+def svg_document_markup(pages):
+    """
+    Turns the SVG pages of a Typst document into page markup. The first page is inlined,
+    each later page becomes a placeholder sized like the page, and the glyph definitions
+    of later pages are deduplicated into one sprite shared by all of them.
+    """
+    pages = [re.sub(r'>\s+<', '><', page.strip()) for page in pages]
+    if len(pages) == 1:
+        return f'<div class="typst-svg-container">{pages[0]}</div>'
+    
+    first_defs = _GLYPH_DEFS.search(pages[0])
+    inlined = set(_GLYPH_SYMBOL.findall(first_defs.group(1))) if first_defs else set()
+    sprite = {}
+    markup = [f'<div class="typst-svg-page">{pages[0]}</div>']
+    for page in pages[1:]:
+        defs = _GLYPH_DEFS.search(page)
+        if defs:
+            for symbol in _GLYPH_SYMBOL.finditer(defs.group(1)):
+                if symbol.group(1) not in inlined:
+                    sprite.setdefault(symbol.group(1), symbol.group(0))
+            page = page[:defs.start()] + page[defs.end():]
+        width, height = _SVG_SIZE.search(page).groups()
+        markup.append(
+            f'<div class="typst-svg-page typst-svg-lazy" data-src="{store_svg_resource(page)}" '
+            f'style="aspect-ratio: {width} / {height}; max-width: {width}pt">'
+            '<noscript><p>This page needs JavaScript.</p></noscript></div>'
+        )
+    
+    glyphs = ""
+    if sprite:
+        url = store_svg_resource(f'<svg xmlns="http://www.w3.org/2000/svg"><defs>{"".join(sprite.values())}</defs></svg>')
+        glyphs = f' data-glyphs="{url}"'
+    return f'<div class="typst-svg-container"{glyphs}>{"".join(markup)}</div><script src="{TYPST_SVG_LOADER}" defer></script>'
+
+def publish_svg_resources(html):
+    """
+    Copies the SVG pages and glyph sprites compiled `html` links to from the compile
+    cache into output/static/typst/. Returns their output paths.
+    """
+    resources = []
+    for name in sorted(set(_TYPST_SVG_RESOURCE.findall(html))):
+        rel_path = f"{TYPST_SVG_URL.strip('/')}/{name}"
+        write_output(rel_path, (COMPILE_CACHE_DIR / name).read_text(encoding="utf-8"))
+        # The name is the content hash
+        record_output(rel_path, {"content": name[:-len(".svg")]})
+        resources.append(rel_path)
+    return resources
+
+def compile_typst(typ_file, use_svg=False, use_typst_html=False, skip_toc=False, promote_headings=False):
+    """
+    Compiles a Typst file to HTML (via Pandoc, Typst HTML, or SVG).
+    Returns (html, ok): the post-processed page body, with BASE_URL already applied to
+    its links, and False for ok if a compiler failed (html is then an error message or None).
+    Results are cached on disk by content hash, so unchanged sources never spawn a compiler.
+    """
+    previous_source = getattr(_current, "source", None)
+    _current.source = typ_file
+    try:
+        with span("compile_typst") as info:
+            key = None
+            if USE_COMPILE_CACHE:
+                key = compile_cache_key(typ_file, use_svg, use_typst_html, skip_toc, promote_headings)
+                cached = read_compile_cache(key)
+                info["cache_hit"] = cached is not None
+                if cached is not None:
+                    return cached, True
+            
+            html, ok = _compile_typst(typ_file, use_svg, use_typst_html, skip_toc, promote_headings)
+            
+            # Never cache failures, they should be retried on the next build
+            if key and ok and html:
+                write_compile_cache(key, html)
+            return html, ok
+    finally:
+        _current.source = previous_source
+
+def _compile_typst(typ_file, use_svg, use_typst_html, skip_toc, promote_headings):
+    """Uncached compile. Returns (html, ok) where ok is False if a compiler failed."""
+    ok = True
     
     if use_typst_html:
         # Read content first to process math
@@ -105,224 +1504,463 @@ def compile_typst(typ_file, use_svg=False, use_typst_html=False, skip_toc=False)
         # Process math
         content_with_placeholders, math_map = process_math(content)
         
-        # Write to temp file for compilation
-        temp_file = typ_file.with_name(f"{typ_file.stem}_temp.typ")
-        with open(temp_file, "w", encoding="utf-8") as f:
-            f.write(content_with_placeholders)
-            
+        # Compiled as text with the source's directory as the root (typst's default for
+        # a file), so imports resolve as usual without a temp file in the content tree
         try:
-            cmd = ["typst", "compile", "--features", "html", "--format", "html", str(temp_file), "-"]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            html = result.stdout
-            
-            # Inject SVGs back
-            # Typst HTML export wraps raw blocks in <code> tags
-            for placeholder, svg in math_map.items():
-                # Try replacing the code block first
-                html = html.replace(f"<code>{placeholder}</code>", svg)
-                # Fallback to simple replacement if code tags aren't there
-                html = html.replace(placeholder, svg)
-                
+            html = compile_typst_source(content_with_placeholders, "html", typ_file.parent)[0]
         except subprocess.CalledProcessError as e:
-            print(f"Error compiling {typ_file}:")
-            print(e.stderr)
+            record_failure(f"Error compiling {typ_file}:\n{e.stderr}", typ_file)
             html = f"<p>Error compiling {typ_file}</p>"
-        finally:
-            temp_file.unlink(missing_ok=True)
+            ok = False
             
-        # Extract body (Typst HTML export outputs full HTML)
-        body_match = re.search(r'<body.*?>(.*?)</body>', html, re.DOTALL)
-        if body_match:
-            html = body_match.group(1)
-            
-        # Add IDs to headers for TOC
-        html = add_header_ids(html)
-        
-        # Generate and prepend TOC (unless skipped)
-        if not skip_toc:
-            toc_html = generate_toc(html, max_depth=3)
-            if toc_html:
-                html = toc_html + html
-        
-        return html
+        return postprocess_typst_html(html, math_map, skip_toc, promote_headings), ok
             
 
     
     elif use_svg:
-        # Compile to SVG using typst
-        svg_file = typ_file.with_suffix(".svg")
         try:
-            subprocess.run(
-                ["typst", "compile", "--format", "svg", str(typ_file), str(svg_file)],
-                check=True,
-                capture_output=True
-            )
-            
-            with open(svg_file, "r", encoding="utf-8") as f:
-                svg_content = f.read()
-            
-            # Clean up
-            svg_file.unlink()
-            
-            # Wrap SVG in a container div
-            return f'<div class="typst-svg-container">{svg_content}</div>'
-            
+            pages = compile_typst_source(typ_file, "svg", typ_file.parent)
         except subprocess.CalledProcessError as e:
-            print(f"Error compiling {typ_file} to SVG: {e.stderr.decode()}")
-            return None
+            record_failure(f"Error compiling {typ_file} to SVG: {e.stderr}", typ_file)
+            return None, False
+        
+        html = svg_document_markup(pages)
+        return run_html_pipeline(html, [fix_paths_stage]), ok
     else:
         # Use Pandoc for HTML conversion
+        content = typ_file.read_text(encoding="utf-8")
+        math_map = {}
+        if MATH_RENDERER == "svg":
+            # Prerender math the same way as for Typst HTML, pandoc only sees placeholders
+            content, math_map = process_math(content)
+        has_local_imports = any(dep.suffix == ".typ" for dep in source_dependencies(typ_file, content))
         try:
-            cmd = [
-                "pandoc", 
-                "-f", "typst", 
-                "-t", "html", 
-                "--mathjax", 
-                "--toc", 
-                "--toc-depth=3", 
-                "--standalone", 
-                "--template=templates/pandoc_content.html",
-                "--lua-filter=scripts/add_ids.lua",
-                str(typ_file)
-            ]
-            result = subprocess.run(
-                cmd,
-                check=True,
-                capture_output=True
-            )
-            html = result.stdout.decode("utf-8")
-            
-            # Post-process: wrap "Last updated" text in a styled span
-            html = re.sub(
-                r'\\(Last updated: ([^)]+)\\)',
-                r'<span class="cv-updated">Last updated: \\1</span>',
-                html
-            )
-            
-            # Protect [INTERACTIVE:...] inside code blocks from replacement
-            def protect_interactive_in_code(match):
-                opening = match.group(1)
-                content = match.group(2)
-                closing = match.group(3)
-                # Replace [INTERACTIVE:...] with HTML entities
-                protected = re.sub(r'\[INTERACTIVE:([a-zA-Z0-9_-]+)\]', r'&#91;INTERACTIVE:\1&#93;', content)
-                return opening + protected + closing
-            
-            html = re.sub(r'(<code>)(.*?)(</code>)', protect_interactive_in_code, html, flags=re.DOTALL)
-            html = re.sub(r'(<pre[^>]*>)(.*?)(</pre>)', protect_interactive_in_code, html, flags=re.DOTALL)
-            
-            # Post-process: inject interactive content from files
-            # Pattern: [INTERACTIVE:path/to/filename] where path is relative to interactive/
-            def load_interactive(match):
-                filepath = match.group(1)
-                # Support subdirectories: interactive/folder/component
-                interactive_file = Path("interactive") / f"{filepath}.html"
-                
-                if interactive_file.exists():
-                    with open(interactive_file, "r", encoding="utf-8") as f:
-                        content = f.read()
-                    return f'<div class="interactive-center">{content}</div>'
+            html = run_pandoc(content, "html", mathjax=True, relative_to=typ_file if has_local_imports else None)
+            return postprocess_pandoc_html(html, math_map, skip_toc, promote_headings), ok
+        except subprocess.CalledProcessError as e:
+            record_failure(f"Error compiling {typ_file}: {e.stderr}", typ_file)
+            return None, False
+
+
+# Post-processing runs as a chain of generator stages over one tokenizer pass:
+# each stage consumes tokens from the previous one and yields (possibly rewritten) tokens.
+# kind is "start", "end", "text", "rawtext" (script/style bodies), "comment" or "raw"
+# (pre-rendered HTML that later stages must not touch). tag is the lowercased tag name.
+HtmlToken = namedtuple("HtmlToken", ["kind", "text", "tag"])
+
+_HTML_TOKEN = re.compile(r'<!--.*?-->|<(/?)([a-zA-Z][\w:-]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>|[^<]+|<', re.DOTALL)
+_RAWTEXT_END = {tag: re.compile(rf'</{tag}', re.IGNORECASE) for tag in ("script", "style")}
+_HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+_INTERACTIVE_MARKER = re.compile(r'\[INTERACTIVE:([a-zA-Z0-9_/-]+)\]')
+_PLACEHOLDER = re.compile(r'__MATH_\d+__')
+
+def tokenize_html(html):
+    pos = 0
+    while pos < len(html):
+        match = _HTML_TOKEN.match(html, pos)
+        text = match.group(0)
+        pos = match.end()
+        if match.group(2):
+            tag = match.group(2).lower()
+            yield HtmlToken("end" if match.group(1) else "start", text, tag)
+            if not match.group(1) and tag in _RAWTEXT_END:
+                # Script and style bodies are opaque, a '<' in there is not a tag
+                end = _RAWTEXT_END[tag].search(html, pos)
+                end = end.start() if end else len(html)
+                if end > pos:
+                    yield HtmlToken("rawtext", html[pos:end], tag)
+                pos = end
+        elif text.startswith("<!--"):
+            yield HtmlToken("comment", text, None)
+        else:
+            yield HtmlToken("text", text, None)
+
+def run_html_pipeline(html, stages):
+    tokens = tokenize_html(html)
+    for stage in stages:
+        tokens = stage(tokens)
+    return "".join(token.text for token in tokens)
+
+def extract_body_stage(tokens):
+    """Keeps only what is inside <body>...</body>, or everything if there is no <body>."""
+    before_body = []
+    in_body = False
+    for token in tokens:
+        if not in_body:
+            if token.kind == "start" and token.tag == "body":
+                in_body = True
+                before_body = None
+            else:
+                before_body.append(token)
+        elif token.kind == "end" and token.tag == "body":
+            return
+        else:
+            yield token
+    if before_body:
+        yield from before_body
+
+def placeholder_stage(replacements):
+    """
+    Substitutes placeholders (e.g. __MATH_0__) from `replacements` in a single pass.
+    Typst HTML export wraps raw blocks in <code> tags, a <code> holding just a placeholder
+    is replaced as a whole.
+    """
+    def substitute(token):
+        if token.kind == "text" and "__MATH_" in token.text:
+            return HtmlToken("raw", _PLACEHOLDER.sub(lambda match: replacements.get(match.group(0), match.group(0)), token.text), None)
+        return token
+    
+    def stage(tokens):
+        window = []
+        for token in tokens:
+            window.append(token)
+            if (len(window) >= 3 and window[-3].kind == "start" and window[-3].tag == "code"
+                    and window[-2].kind == "text" and window[-2].text in replacements
+                    and window[-1].kind == "end" and window[-1].tag == "code"):
+                window[-3:] = [HtmlToken("raw", replacements[window[-2].text], None)]
+            # Tokens this far back can no longer start a <code> match
+            while len(window) > 2:
+                yield substitute(window.pop(0))
+        for token in window:
+            yield substitute(token)
+    return stage
+
+def slugify_heading(text):
+    # Lowercase, whitespace to dashes, drop anything but ASCII letters, digits and dashes
+    slug = text.lower().strip()
+    slug = re.sub(r'\s+', '-', slug)
+    return re.sub(r'[^a-z0-9-]', '', slug)
+
+_ARIA_LABEL = re.compile(r'\baria-label="([^"]*)"')
+
+def heading_text(tokens):
+    """
+    Plain text of a heading's inner tokens. Pre-rendered math counts as its aria-label
+    (the math source), never as SVG markup.
+    """
+    parts = []
+    for token in tokens:
+        if token.kind == "text":
+            parts.append(token.text)
+        elif token.kind == "raw":
+            svg_depth = 0
+            for inner in tokenize_html(token.text):
+                if inner.tag == "svg" and inner.kind == "start":
+                    svg_depth += 1
+                    label = _ARIA_LABEL.search(inner.text)
+                    if svg_depth == 1 and label:
+                        parts.append(label.group(1))
+                elif inner.tag == "svg" and inner.kind == "end":
+                    svg_depth -= 1
+                elif inner.kind == "text" and not svg_depth:
+                    parts.append(inner.text)
+    return "".join(parts)
+
+def header_id_stage(headings):
+    """
+    Adds slug IDs to headings that don't have one (for TOC linking) and appends
+    (level, id, text) for every heading with an ID to `headings`. Generated IDs
+    are made unique within the page.
+    """
+    def stage(tokens):
+        used = set()
+        heading = None
+        for token in tokens:
+            if heading is None:
+                if token.kind == "start" and token.tag in _HEADING_TAGS:
+                    heading = [token]
                 else:
-                    print(f"Warning: Interactive file not found: {interactive_file}")
-                    return f"<!-- Interactive component '{filepath}' not found -->"
+                    yield token
+                continue
             
-            html = re.sub(
-                r'\[INTERACTIVE:([a-zA-Z0-9_/-]+)\]',
-                load_interactive,
-                html
-            )
+            heading.append(token)
+            if not (token.kind == "end" and token.tag == heading[0].tag):
+                continue
             
-            # Legacy support for old marker
-            html = re.sub(
-                r'\[INTERACTIVE_P5_SKETCH\]',
-                lambda m: load_interactive(re.match(r'.*', 'p5-sketch')),
-                html
-            )
+            opening, inner, heading = heading[0], heading[1:-1], None
+            # Clean HTML from content
+            text = heading_text(inner)
+            id_match = re.search(r'\bid=["\']([^"\']+)["\']', opening.text)
+            if 'id=' in opening.text:
+                heading_id = id_match.group(1) if id_match else None
+            else:
+                base = heading_id = slugify_heading(text)
+                suffix = 0
+                while heading_id in used:
+                    suffix += 1
+                    heading_id = f"{base}-{suffix}"
+                end = -2 if opening.text.endswith("/>") else -1
+                attrs = opening.text[len(opening.tag) + 1:end]
+                new_attrs = f'{attrs} id="{heading_id}"' if attrs.strip() else f' id="{heading_id}"'
+                opening = HtmlToken("start", f"<{opening.tag}{new_attrs}>", opening.tag)
             
-            return html
-        except subprocess.CalledProcessError as e:
-            print(f"Error compiling {typ_file}: {e.stderr.decode()}")
-            return None
+            if heading_id:
+                used.add(heading_id)
+                headings.append((int(opening.tag[1]), heading_id, text))
+            yield opening
+            yield from inner
+            yield token
+        if heading:
+            yield from heading
+    return stage
 
+def promote_headings_stage(tokens):
+    """Promotes headings one level: h2 -> h1, h3 -> h2, etc."""
+    for token in tokens:
+        if token.kind in ("start", "end") and token.tag in _HEADING_TAGS and token.tag != "h1":
+            tag = f"h{int(token.tag[1]) - 1}"
+            token = HtmlToken(token.kind, token.text[:1 + (token.kind == "end")] + tag + token.text[3 + (token.kind == "end"):], tag)
+        yield token
 
-def add_header_ids(html):
-    """Add IDs to headers that don't have them (for TOC linking)."""
-    def add_id(match):
-        tag = match.group(1)
-        attrs = match.group(2)
-        content = match.group(3)
-        close_tag = match.group(4)
-        
-        # Check if already has an id
-        if 'id=' in attrs:
-            return match.group(0)
-        
-        # Generate slugified ID from content
-        # Remove HTML tags from content for slug
-        text_content = re.sub(r'<[^>]+>', '', content)
-        slug = text_content.lower().strip()
-        slug = re.sub(r'\s+', '-', slug)
-        slug = re.sub(r'[^a-z0-9-]', '', slug)
-        
-        # Add id attribute with proper spacing
-        if attrs.strip():
-            new_attrs = f'{attrs} id="{slug}"'
-        else:
-            new_attrs = f' id="{slug}"'
-        return f'<{tag}{new_attrs}>{content}</{close_tag}>'
-    
-    # Match h1-h6 tags
-    html = re.sub(r'<(h[1-6])([^>]*)>(.*?)</(\1)>', add_id, html, flags=re.DOTALL)
-    return html
+def last_updated_stage(tokens):
+    """Wraps "(Last updated: ...)" text in a styled span."""
+    for token in tokens:
+        if token.kind == "text" and "Last updated" in token.text:
+            token = HtmlToken("text", re.sub(
+                r'\(Last updated: ([^)]+)\)',
+                r'<span class="cv-updated">Last updated: \1</span>',
+                token.text
+            ), None)
+        yield token
 
-def generate_toc(html, max_depth=3):
-    """Generate table of contents from headers in HTML."""
-    # Find all headers with IDs
-    header_pattern = r'<(h[1-6])[^>]*id=["\']([^"\']+)["\'][^>]*>(.*?)</\1>'
-    headers = re.findall(header_pattern, html, re.DOTALL)
+# Component name -> (mtime_ns, libraries, markup), so each component file is read and
+# parsed once no matter how many pages embed it
+_interactive_cache = {}
+_interactive_lock = threading.Lock()
+
+def load_interactive(filepath):
+    """
+    Returns (libraries, markup) for [INTERACTIVE:filepath], where the path is relative
+    to interactive/, or None if there is no such component. Libraries are the src URLs
+    of the component's external <script> tags, markup is everything else.
+    """
+    # Support subdirectories: interactive/folder/component
+    interactive_file = INTERACTIVE_DIR / f"{filepath}.html"
+    try:
+        mtime_ns = interactive_file.stat().st_mtime_ns
+    except FileNotFoundError:
+        log(f"Warning: Interactive file not found: {interactive_file}")
+        return None
     
-    if not headers:
-        return ""
+    with _interactive_lock:
+        cached = _interactive_cache.get(filepath)
+    if cached and cached[0] == mtime_ns:
+        return cached[1:]
     
-    toc_items = []
-    for tag, id_attr, content in headers:
-        level = int(tag[1])  # Extract number from h1, h2, etc.
-        if level > max_depth:
+    libraries = []
+    markup = []
+    tokens = tokenize_html(interactive_file.read_text(encoding="utf-8"))
+    for token in tokens:
+        src = re.search(r'\bsrc=(["\'])(.*?)\1', token.text) if token.kind == "start" and token.tag == "script" else None
+        if src:
+            # External scripts (and their empty bodies) are hoisted out of the component
+            libraries.append(src.group(2))
+            for token in tokens:
+                if token.kind == "end" and token.tag == "script":
+                    break
             continue
+        markup.append(token.text)
+    
+    entry = (mtime_ns, tuple(libraries), "".join(markup).strip())
+    with _interactive_lock:
+        _interactive_cache[filepath] = entry
+    return entry[1:]
+
+def interactive_placeholder(name, libraries):
+    """
+    Lazily activated embed for component `name`. The markup sits inert in a <template>
+    until static/js/interactive.js sees the placeholder near the viewport, loads the
+    libraries it needs (indices into `libraries`, the page's deduplicated list) and
+    mounts it. Returns None if the component doesn't exist.
+    """
+    component = load_interactive(name)
+    if component is None:
+        return None
+    component_libraries, markup = component
+    indices = []
+    for src in component_libraries:
+        src = fix_url(src)
+        if src not in libraries:
+            libraries.append(src)
+        indices.append(str(libraries.index(src)))
+    return (
+        f'<div class="interactive-center interactive-lazy" data-interactive="{name}" data-libraries="{" ".join(indices)}">'
+        f'<template>{markup}</template>'
+        f'<noscript><p>This interactive component needs JavaScript.</p></noscript>'
+        f'</div>'
+    )
+
+def interactive_stage(tokens):
+    """
+    Replaces [INTERACTIVE:...] markers with lazy component placeholders. Markers inside
+    <code>/<pre> are escaped instead so they show up literally, and a paragraph holding
+    nothing but a marker is replaced as a whole. Component markup is tokenized too, so
+    later stages (like fix_paths) see it. If the page embeds anything, the libraries the
+    components need are listed once at the end, followed by the loader script.
+    """
+    libraries = []
+    embedded = False
+    code_depth = 0
+    # (token, whether it is inside <code>/<pre>), held back to spot <p>marker</p>
+    window = []
+    
+    def expand(token, in_code):
+        nonlocal embedded
+        if token.kind != "text" or "[INTERACTIVE" not in token.text:
+            yield token
+            return
+        if in_code:
+            # Replace [INTERACTIVE:...] with HTML entities
+            yield HtmlToken("text", _INTERACTIVE_MARKER.sub(r'&#91;INTERACTIVE:\1&#93;', token.text), None)
+            return
         
-        # Clean HTML from content
-        text = re.sub(r'<[^>]+>', '', content)
-        toc_items.append((level, id_attr, text))
+        # Legacy support for old marker
+        text = token.text.replace("[INTERACTIVE_P5_SKETCH]", "[INTERACTIVE:p5-sketch]")
+        pos = 0
+        for match in _INTERACTIVE_MARKER.finditer(text):
+            if match.start() > pos:
+                yield HtmlToken("text", text[pos:match.start()], None)
+            placeholder = interactive_placeholder(match.group(1), libraries)
+            if placeholder is None:
+                yield HtmlToken("comment", f"<!-- Interactive component '{match.group(1)}' not found -->", None)
+            else:
+                embedded = True
+                yield from tokenize_html(placeholder)
+            pos = match.end()
+        if pos < len(text):
+            yield HtmlToken("text", text[pos:], None)
     
+    for token in tokens:
+        if token.kind in ("start", "end") and token.tag in ("code", "pre"):
+            code_depth += 1 if token.kind == "start" else -1
+        window.append((token, code_depth > 0))
+        if len(window) >= 3:
+            (opening, _), (text, in_code), (closing, _) = window[-3:]
+            if (opening.kind == "start" and opening.tag == "p" and closing.kind == "end" and closing.tag == "p"
+                    and text.kind == "text" and not in_code and _INTERACTIVE_MARKER.fullmatch(text.text.strip())):
+                # A <div> can't live inside a <p>, drop the paragraph around a lone marker
+                del window[-3:]
+                window.append((HtmlToken("text", text.text.strip(), None), False))
+        while len(window) > 2:
+            yield from expand(*window.pop(0))
+    for token, in_code in window:
+        yield from expand(token, in_code)
+    
+    if embedded:
+        # Escaped so a URL can't close the <script> element early
+        library_list = json.dumps(libraries).replace("</", "<\\/")
+        yield from tokenize_html(
+            f'<script type="application/json" id="interactive-libraries">{library_list}</script>'
+            f'<script src="{INTERACTIVE_LOADER}" defer></script>'
+        )
+
+# Regex to match href="/...", src="/...", action="/..."
+# Excludes: mailto:, #anchors, //, http://, https://
+# Matches: attr=" /path " or attr=' /path '
+# Captures: 1=attr name, 2=quote, 3=path
+_ABSOLUTE_PATH_ATTR = re.compile(r'(href|src|action)=([\"\'])\s*/(?![/#])([^\"\']*)\2')
+
+def fix_url(url):
+    """Applies BASE_URL and asset fingerprints to a site-absolute URL, leaves others alone."""
+    if not url.startswith("/") or url.startswith("//"):
+        return url
+    # Point static CSS/JS at their fingerprinted files
+    path, sep, rest = url.partition("?") if "?" in url else url.partition("#")
+    return f"{BASE_URL}{_asset_urls.get(path, path)}{sep}{rest}"
+
+def _prefix_base_url(match):
+    attr = match.group(1)
+    quote = match.group(2)
+    path = match.group(3)
+    # Skip mailto links
+    if path.startswith('mailto:'):
+        return match.group(0)
+    return f'{attr}={quote}{fix_url("/" + path)}{quote}'
+
+def fix_paths_stage(tokens):
+    """
+    Prepends BASE_URL to absolute paths in href/src/action attributes and points
+    references to static CSS/JS at their fingerprinted files.
+    """
+    for token in tokens:
+        if token.kind == "start" and (BASE_URL or _asset_urls) and "=" in token.text:
+            token = HtmlToken("start", _ABSOLUTE_PATH_ATTR.sub(_prefix_base_url, token.text), token.tag)
+        yield token
+
+def postprocess_typst_html(html, math_map, skip_toc=False, promote_headings=False):
+    """
+    Extracts the body of Typst HTML export output (it outputs a full document), injects
+    the math back and interactive components, adds IDs to headers and collects them for
+    the TOC, all in one pass.
+    """
+    headings = []
+    stages = [extract_body_stage, placeholder_stage(math_map), interactive_stage, header_id_stage(headings)]
+    if promote_headings:
+        stages.append(promote_headings_stage)
+    stages.append(fix_paths_stage)
+    with span("postprocess", bytes=len(html)):
+        html = run_html_pipeline(html, stages)
+    
+    # Prepend TOC (unless skipped)
+    if not skip_toc:
+        html = build_toc(headings, max_depth=3) + html
+    return html
+
+def postprocess_pandoc_html(html, math_map=None, skip_toc=False, promote_headings=False):
+    """
+    Post-processes Pandoc output in one pass: injects prerendered math, wraps "Last updated"
+    text in a styled span, injects interactive components (but not inside code blocks),
+    adds IDs to headers and collects them for the TOC, and fixes paths.
+    """
+    headings = []
+    stages = [extract_body_stage, placeholder_stage(math_map or {}), last_updated_stage, interactive_stage, header_id_stage(headings)]
+    if promote_headings:
+        stages.append(promote_headings_stage)
+    stages.append(fix_paths_stage)
+    with span("postprocess", bytes=len(html)):
+        html = run_html_pipeline(html, stages)
+    
+    # Prepend TOC (unless skipped)
+    if not skip_toc:
+        html = build_toc(headings, max_depth=3) + html
+    return html
+
+def build_toc(headings, max_depth=3):
+    """Builds the nested TOC for (level, id, text) headings."""
+    toc_items = [heading for heading in headings if heading[0] <= max_depth]
     if not toc_items:
         return ""
     
     # Build nested HTML structure
-    toc_html = '<nav id="TOC" role="doc-toc">\n<ul>\n'
-    current_level = toc_items[0][0]
+    top_level = min(level for level, _, _ in toc_items)
+    parts = ['<nav id="TOC" role="doc-toc">\n<ul>\n']
+    current_level = None
     
     for level, id_attr, text in toc_items:
-        # Handle level changes
-        while level > current_level:
-            toc_html += '<ul>\n'
+        if current_level is None:
+            current_level = top_level
+        elif level > current_level:
+            # Nest inside the open item; skipped levels only nest one deeper
+            parts.append('<ul>\n')
             current_level += 1
-        while level < current_level:
-            toc_html += '</ul>\n</li>\n'
-            current_level -= 1
-        
-        # Close previous item if at same level
-        if level == current_level and toc_items.index((level, id_attr, text)) > 0:
-            toc_html += '</li>\n'
+        else:
+            # Close previous item, then any lists deeper than this one
+            parts.append('</li>\n')
+            while level < current_level:
+                parts.append('</ul>\n</li>\n')
+                current_level -= 1
         
-        toc_html += f'<li><a href="#{id_attr}" id="toc-{id_attr}">{text}</a>'
+        # Labels are plain text; markup (math SVGs and their ids) stays in the heading itself
+        parts.append(f'<li><a href="#{id_attr}" id="toc-{id_attr}">{re.sub(r"<[^>]*>", "", text)}</a>')
     
     # Close remaining tags
-    while current_level > toc_items[0][0]:
-        toc_html += '</ul>\n</li>\n'
+    parts.append('</li>\n')
+    while current_level > top_level:
+        parts.append('</ul>\n</li>\n')
         current_level -= 1
     
-    toc_html += '</li>\n</ul>\n</nav>\n'
-    return toc_html
+    parts.append('</ul>\n</nav>\n')
+    return "".join(parts)
 
 def fix_paths(html):
     """
@@ -330,44 +1968,70 @@ def fix_paths(html):
     Ignores paths that already start with http, https, or relative paths.
     Does NOT modify anchor links (#) or mailto: links.
     """
-    if not BASE_URL:
+    if not BASE_URL and not _asset_urls:
         return html
-        
-    # Regex to match href="/...", src="/...", action="/..."
-    # Excludes: mailto:, #anchors, //, http://, https://
-    # Matches: attr=" /path " or attr=' /path '
-    # Captures: 1=attr name, 2=quote, 3=path
-    pattern = r'(href|src|action)=([\"\'])\s*/(?![/#])([^\"\']*)\2'
-    
-    def replace_path(match):
-        attr = match.group(1)
-        quote = match.group(2)
-        path = match.group(3)
-        # Skip mailto links
-        if path.startswith('mailto:'):
-            return match.group(0)
-        return f'{attr}={quote}{BASE_URL}/{path}{quote}'
-    
-    return re.sub(pattern, replace_path, html)
+    return run_html_pipeline(html, [fix_paths_stage])
+
+def _bracket_delta(line):
+    """
+    Net number of brackets a line opens, ignoring brackets inside string literals.
+    Braces count too, so a multi-line code block (`#let f() = { ... }`) keeps the rule open.
+    """
+    code = re.sub(r'"(?:[^"\\]|\\.)*"', '""', line.split("//", 1)[0] if not line.lstrip().startswith("//") else "")
+    return sum(map(code.count, "([{")) - sum(map(code.count, ")]}"))
 
-def parse_metadata(typ_content):
-    """Extracts title, date, tags, and abstract from Typst content."""
-    title_match = re.search(r'#set document\(.*?title:\s*"(.*?)".*?\)', typ_content, re.DOTALL)
-    date_match = re.search(r'date:\s*datetime\(.*?year:\s*(\d+).*?month:\s*(\d+).*?day:\s*(\d+).*?\)', typ_content, re.DOTALL)
+def read_preamble(lines):
+    """
+    Collects the preamble of a Typst source from an iterable of lines: leading blank lines,
+    // comments and #set/#import/#show/... rules, including rules spanning several lines.
+    Stops at the first content line, or after MAX_PREAMBLE_BYTES, so the rest of the
+    file is never read.
+    """
+    preamble = []
+    size = 0
+    depth = 0
+    for line in lines:
+        stripped = line.strip()
+        if depth <= 0 and stripped and not stripped.startswith(("//", "#")):
+            break
+        preamble.append(line)
+        depth = max(depth + _bracket_delta(line), 0)
+        size += len(line)
+        if size > MAX_PREAMBLE_BYTES:
+            break
+    return "".join(preamble)
+
+def parse_preamble(preamble):
+    """Extracts title, date, tags, and abstract from a Typst preamble."""
+    document_match = re.search(r'#set\s+document\(', preamble)
+    document_args = ""
+    if document_match:
+        # Everything up to the matching closing parenthesis
+        depth = 1
+        end = document_match.end()
+        while end < len(preamble) and depth:
+            depth += {"(": 1, ")": -1}.get(preamble[end], 0)
+            end += 1
+        document_args = preamble[document_match.end():end]
+    
+    title_match = re.search(r'title:\s*"((?:[^"\\]|\\.)*)"', document_args)
+    date_match = re.search(r'date:\s*datetime\(([^)]*)\)', preamble)
     
     # Extract tags from a comment like: // tags: topology, homotopy, math
-    tags_match = re.search(r'//\s*tags:\s*(.+)', typ_content)
+    tags_match = re.search(r'//\s*tags:\s*(.+)', preamble)
     
     # Extract abstract from a comment like: // abstract: This post explores...
-    abstract_match = re.search(r'//\s*abstract:\s*(.+)', typ_content)
+    abstract_match = re.search(r'//\s*abstract:\s*(.+)', preamble)
     
     title = title_match.group(1) if title_match else "Untitled"
     
     # Parse date properly and format nicely
+    date_parts = {}
     if date_match:
-        year, month, day = date_match.groups()
+        date_parts = dict(re.findall(r'(year|month|day):\s*(\d+)', date_match.group(1)))
+    if len(date_parts) == 3:
+        year, month, day = date_parts["year"], date_parts["month"], date_parts["day"]
         # Create a nice date format: "Nov 28, 2025"
-        from datetime import datetime
         date_obj = datetime(int(year), int(month), int(day))
         date = date_obj.strftime("%b %d, %Y")
         date_iso = f"{year}-{month.zfill(2)}-{day.zfill(2)}"  # For sorting
@@ -385,233 +2049,767 @@ def parse_metadata(typ_content):
     
     return {"title": title, "date": date, "date_iso": date_iso, "tags": tags, "abstract": abstract}
 
-def render_template(template_name, context):
-    """Simple template rendering (replacing {{ key }})."""
-    template_path = TEMPLATES_DIR / template_name
-    with open(template_path, "r", encoding="utf-8") as f:
-        template = f.read()
-    
-    # Handle inheritance (very basic)
-    if "{% extends" in template:
-        base_match = re.search(r'{% extends "(.*?)" %}', template)
-        if base_match:
-            base_name = base_match.group(1)
-            with open(TEMPLATES_DIR / base_name, "r", encoding="utf-8") as f:
-                base = f.read()
-            
-            # Extract blocks
-            blocks = {}
-            for match in re.finditer(r'{% block (.*?) %}(.*?){% endblock %}', template, re.DOTALL):
-                blocks[match.group(1)] = match.group(2)
-            
-            # Replace blocks in base
-            for block_name, block_content in blocks.items():
-                base = re.sub(r'{% block ' + block_name + r' %}.*?{% endblock %}', block_content, base, flags=re.DOTALL)
-            
-            template = base
-
-    # Handle basic if blocks: {% if key %}...{% endif %}
-    # We support simple boolean checks on context keys
-    while True:
-        if_match = re.search(r'{% if (.*?) %}(.*?){% endif %}', template, re.DOTALL)
-        if not if_match:
-            break
-            
-        condition_key = if_match.group(1).strip()
-        block_content = if_match.group(2)
-        
-        # Check if key exists and is truthy in context
-        if context.get(condition_key):
-            template = template.replace(if_match.group(0), block_content)
-        else:
-            template = template.replace(if_match.group(0), "")
+def parse_metadata(typ_content):
+    """Extracts title, date, tags, and abstract from the preamble of Typst content."""
+    return parse_preamble(read_preamble(typ_content.splitlines(keepends=True)))
 
-    # Replace variables
-    for key, value in context.items():
-        template = template.replace(f"{{{{ {key} }}}}", str(value))
-        
-    return template
+def load_metadata_index():
+    global _metadata_index
+    try:
+        index = json.loads(METADATA_INDEX.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        index = {}
+    if index.get("version") != METADATA_INDEX_VERSION:
+        index = {}
+    _metadata_index = index.get("files", {})
 
-def build_blog():
-    posts = []
-    blog_output_dir = OUTPUT_DIR / "blog"
-    blog_output_dir.mkdir(exist_ok=True)
+def save_metadata_index():
+    global _metadata_index_dirty
+    if not _metadata_index_dirty:
+        return
+    with _metadata_lock:
+        index = {"version": METADATA_INDEX_VERSION, "files": dict(sorted(_metadata_index.items()))}
+        _metadata_index_dirty = False
+    atomic_write(METADATA_INDEX, json.dumps(index, indent=1))
 
-    for typ_file in BLOG_DIR.glob("*.typ"):
-        print(f"Processing {typ_file}...")
-        
-        # Read raw content for metadata extraction
+def load_metadata(typ_file):
+    """
+    Returns the metadata of a Typst source. Results are kept in the persisted metadata
+    index keyed by path, size and mtime, so unchanged files are never opened; changed
+    files are scanned only up to the end of their preamble.
+    """
+    global _metadata_index_dirty
+    if _metadata_index is None:
+        load_metadata_index()
+    
+    key = typ_file.as_posix()
+    stat = typ_file.stat()
+    with _metadata_lock:
+        entry = _metadata_index.get(key)
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["metadata"]
+    
+    with span("scan_metadata"):
         with open(typ_file, "r", encoding="utf-8") as f:
-            raw_content = f.read()
-            
-        metadata = parse_metadata(raw_content)
+            metadata = parse_preamble(read_preamble(f))
+    
+    with _metadata_lock:
+        _metadata_index[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "metadata": metadata}
+        _metadata_index_dirty = True
+    return metadata
+
+def prune_metadata_index(keep):
+    """Drops index entries for sources that no longer exist."""
+    global _metadata_index_dirty
+    if _metadata_index is None:
+        return
+    keep = {Path(path).as_posix() for path in keep}
+    with _metadata_lock:
+        for key in [key for key in _metadata_index if key not in keep]:
+            del _metadata_index[key]
+            _metadata_index_dirty = True
+
+# Template name -> (mtimes of the template and its base, compiled node list)
+_template_cache = {}
+_template_lock = threading.Lock()
+
+_TEMPLATE_TAG = re.compile(r'({%.*?%}|{{.*?}})', re.DOTALL)
+
+def parse_template(source, template_name):
+    """
+    Parses template source into a node tree. Nodes are tuples:
+    ("text", str), ("var", key), ("if", key, children), ("block", name, children)
+    and ("extends", base_name) which only ever appears first.
+    """
+    root = []
+    stack = [(None, None, root)]
+    
+    for piece in _TEMPLATE_TAG.split(source):
+        if not piece:
+            continue
+        children = stack[-1][2]
         
-        # Compile to HTML or SVG
-        html_content = compile_typst(typ_file, use_svg=USE_SVG_FOR_BLOG, use_typst_html=USE_TYPST_HTML_FOR_BLOG)
-        if not html_content:
+        if piece.startswith("{{") and piece.endswith("}}"):
+            children.append(("var", piece[2:-2].strip()))
+            continue
+        if not (piece.startswith("{%") and piece.endswith("%}")):
+            children.append(("text", piece))
             continue
-            
-        # Extract body from full HTML if Typst outputs full page
-        # Typst HTML export is experimental, it might output a full <html> document.
-        # We might need to extract just the body content.
-        # For now, let's assume we dump it as is or extract <body> content.
-        
-        body_match = re.search(r'<body.*?>(.*?)</body>', html_content, re.DOTALL)
-        if body_match:
-            html_content = body_match.group(1)
-            
-        slug = typ_file.stem
-        post_dir = blog_output_dir / slug
-        post_dir.mkdir(exist_ok=True)
         
-        context = {
-            "title": metadata["title"],
-            "date": metadata["date"],
-            "content": html_content,
-            "show_title": True
-        }
+        tag = piece[2:-2].strip()
+        keyword, _, argument = tag.partition(" ")
+        argument = argument.strip()
         
-        final_html = render_template("post.html", context)
+        if keyword == "extends":
+            base_match = re.fullmatch(r'"(.*?)"', argument)
+            if not base_match or len(stack) > 1:
+                raise ValueError(f"{template_name}: invalid extends tag: {piece}")
+            root.append(("extends", base_match.group(1)))
+        elif keyword in ("if", "block"):
+            stack.append((keyword, argument, []))
+        elif keyword in ("endif", "endblock"):
+            opened, argument, block_children = stack.pop() if len(stack) > 1 else (None, None, None)
+            if opened != keyword[3:]:
+                raise ValueError(f"{template_name}: unexpected {piece}")
+            stack[-1][2].append((opened, argument, block_children))
+        else:
+            raise ValueError(f"{template_name}: unknown tag {piece}")
+    
+    if len(stack) > 1:
+        raise ValueError(f"{template_name}: unclosed {{% {stack[-1][0]} %}}")
+    return root
+
+def _fill_blocks(nodes, blocks):
+    """Replaces block nodes of a base template with the child's overrides."""
+    filled = []
+    for node in nodes:
+        if node[0] == "block":
+            filled.append(("block", node[1], blocks.get(node[1], _fill_blocks(node[2], blocks))))
+        elif node[0] == "if":
+            filled.append(("if", node[1], _fill_blocks(node[2], blocks)))
+        else:
+            filled.append(node)
+    return filled
+
+def _collect_blocks(nodes, blocks):
+    for node in nodes:
+        if node[0] == "block":
+            blocks[node[1]] = node[2]
+        if node[0] in ("block", "if"):
+            _collect_blocks(node[2], blocks)
+    return blocks
+
+def load_template(template_name):
+    """
+    Returns the compiled node list for a template with inheritance already resolved.
+    Compiled templates are cached by name and re-parsed only when a file's mtime changes.
+    """
+    with _template_lock:
+        cached = _template_cache.get(template_name)
+    if cached:
+        mtimes, nodes, files = cached
+        if _template_mtimes(files) == mtimes:
+            return nodes
+    
+    path = TEMPLATES_DIR / template_name
+    nodes = parse_template(path.read_text(encoding="utf-8"), template_name)
+    files = [template_name]
+    if nodes and nodes[0][0] == "extends":
+        # Handle inheritance: the child's blocks override the base's
+        base_name = nodes[0][1]
+        base_nodes = load_template(base_name)
+        nodes = _fill_blocks(base_nodes, _collect_blocks(nodes[1:], {}))
+        files.extend(_template_cache[base_name][2])
+    
+    with _template_lock:
+        _template_cache[template_name] = (_template_mtimes(files), nodes, files)
+    return nodes
+
+def _template_mtimes(files):
+    mtimes = []
+    for name in files:
+        try:
+            mtimes.append((TEMPLATES_DIR / name).stat().st_mtime_ns)
+        except FileNotFoundError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+def _render_nodes(nodes, context, out):
+    for node in nodes:
+        kind = node[0]
+        if kind == "text":
+            out.append(node[1])
+        elif kind == "var":
+            # Unknown keys are left as-is, like the original string replacement did
+            out.append(str(context[node[1]]) if node[1] in context else f"{{{{ {node[1]} }}}}")
+        elif kind == "if":
+            # Simple truthiness check on a context key
+            if context.get(node[1]):
+                _render_nodes(node[2], context, out)
+        else:
+            _render_nodes(node[2], context, out)
+
+def render_template(template_name, context):
+    """
+    Renders a template in a single pass. Supports {{ key }}, {% if key %}...{% endif %},
+    {% block name %}...{% endblock %} and {% extends "base.html" %}.
+    """
+    with span("render_template", template=template_name):
+        out = []
+        _render_nodes(load_template(template_name), context, out)
+        return "".join(out)
+
+# Start tags at the top of <body> treated as above the fold when picking critical CSS
+CRITICAL_CSS_FOLD_TAGS = 80
+_STYLESHEET_LINK = re.compile(r'<link rel="stylesheet" href="([^"]+)">')
+_HTML_ATTRIBUTE = re.compile(r'([\w:-]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?')
+# Parsed stylesheets by output path: (digest, rules)
+_stylesheet_cache = {}
+_stylesheet_lock = threading.Lock()
+
+def parse_css_rules(css):
+    """
+    Splits CSS into (prelude, body) pairs. The body of an @media or @supports rule is
+    itself a list of rules, any other body is its text, verbatim with any nested blocks
+    (e.g. the frames of @keyframes). Statement at-rules (@import, @charset, @namespace)
+    have a body of None.
+    """
+    rules = []
+    # Open blocks, innermost last: the rule list being filled and, inside a rule, its prelude
+    stack = [(rules, None)]
+    text = []
+    # Braces open inside the body of the current rule, copied into its text as they are
+    depth = 0
+    for piece in _CSS_PIECE.findall(css):
+        if piece.startswith("/*") or piece[0] in "\"'":
+            text.append(piece)
+            continue
+        for part in re.split(r'([{};])', piece):
+            if part == ";" and stack[-1][1] is None:
+                # A ';' outside any rule body ends a statement at-rule
+                statement = "".join(text).strip()
+                text.clear()
+                if statement:
+                    stack[-1][0].append((statement, None))
+            elif part == ";":
+                text.append(part)
+            elif part == "{" and stack[-1][1] is not None:
+                depth += 1
+                text.append(part)
+            elif part == "}" and depth:
+                depth -= 1
+                text.append(part)
+            elif part == "{":
+                prelude = "".join(text).strip()
+                text.clear()
+                block = stack[-1][0]
+                if prelude.startswith(("@media", "@supports")):
+                    nested = []
+                    block.append((prelude, nested))
+                    stack.append((nested, None))
+                else:
+                    stack.append((block, prelude))
+            elif part == "}":
+                block, prelude = stack.pop() if len(stack) > 1 else stack[0]
+                if prelude is not None:
+                    block.append((prelude, "".join(text).strip()))
+                text.clear()
+            else:
+                text.append(part)
+    return rules
+
+def selector_tokens(selector):
+    """Tag names, .classes, #ids and [attributes] an element set needs for `selector` to match."""
+    # Pseudo-classes and -elements (:hover, ::before, :not(...)) only narrow a match down
+    selector = re.sub(r'"[^"]*"|\'[^\']*\'', '', selector)
+    selector = re.sub(r'::?[\w-]+(\([^)]*\))?', '', selector)
+    tokens = set(re.findall(r'[#.][\w-]+|\[[\w-]+', selector))
+    tokens.update(re.findall(r'(?:^|(?<=[\s>+~]))([a-zA-Z][\w-]*)', selector))
+    return tokens
+
+def fold_tokens(html):
+    """Tags, classes, ids and attribute names of the head and the first start tags of the body."""
+    tokens = {"html", "head", "body"}
+    in_body = False
+    seen = 0
+    for token in tokenize_html(html):
+        if token.kind != "start":
+            continue
+        if token.tag == "body":
+            in_body = True
+            continue
+        tokens.add(token.tag)
+        for name, double, single, bare in _HTML_ATTRIBUTE.findall(token.text[len(token.tag) + 1:].rstrip("/>")):
+            value = double or single or bare
+            tokens.add(f"[{name.lower()}")
+            if name.lower() == "class":
+                tokens.update(f".{cls}" for cls in value.split())
+            elif name.lower() == "id":
+                tokens.add(f"#{value}")
+        if in_body:
+            seen += 1
+            if seen >= CRITICAL_CSS_FOLD_TAGS:
+                break
+    return tokens
+
+def critical_rules(rules, tokens):
+    """The rules with at least one selector that can match an element in `tokens`."""
+    kept = []
+    for prelude, body in rules:
+        if body is None:
+            # Statement at-rules apply to the whole sheet
+            kept.append(f"{prelude};")
+        elif isinstance(body, list):
+            inner = critical_rules(body, tokens)
+            if inner:
+                kept.append(f"{prelude}{{{inner}}}")
+        elif prelude.startswith("@") or any(selector_tokens(sel) <= tokens for sel in prelude.split(",")):
+            kept.append(f"{prelude}{{{body}}}")
+    return "".join(kept)
+
+def stylesheet_rules(url):
+    """Parsed rules of a stylesheet this build wrote, or None if `url` isn't one."""
+    if BASE_URL and url.startswith(BASE_URL):
+        url = url[len(BASE_URL):]
+    path = OUTPUT_DIR / url.lstrip("/")
+    if not url.startswith("/") or not path.is_file():
+        return None
+    digest = file_digest(path)
+    with _stylesheet_lock:
+        cached = _stylesheet_cache.get(path)
+    if cached and cached[0] == digest:
+        return cached[1]
+    rules = parse_css_rules(path.read_text(encoding="utf-8"))
+    with _stylesheet_lock:
+        _stylesheet_cache[path] = (digest, rules)
+    return rules
+
+def inline_critical_css(html):
+    """
+    Inlines the rules of each local stylesheet that the page's head and the top of its
+    body can use, and turns the stylesheet link into a non-blocking load of the full file.
+    """
+    if not INLINE_CRITICAL_CSS:
+        return html
+    tokens = None
+    
+    def replace(match):
+        nonlocal tokens
+        rules = stylesheet_rules(match.group(1))
+        if rules is None:
+            return match.group(0)
+        if tokens is None:
+            tokens = fold_tokens(html)
+        href = match.group(1)
+        return (
+            f"<style>{critical_rules(rules, tokens)}</style>"
+            f"<link rel=\"preload\" as=\"style\" href=\"{href}\" onload=\"this.onload=null;this.rel='stylesheet'\">"
+            f"<noscript><link rel=\"stylesheet\" href=\"{href}\"></noscript>"
+        )
+    
+    return _STYLESHEET_LINK.sub(replace, html)
+
+def prefetch_hints(urls):
+    """<link rel="prefetch"> hints for pages the reader is likely to open next."""
+    return "".join(f'<link rel="prefetch" href="{url}">' for url in urls)
+
+def render_page(template_name, context):
+    """
+    Renders a template around compiled content. The content already went through
+    fix_paths in compile_typst, so only the template shell is rescanned for paths.
+    """
+    marker = "\0content\0"
+    # Apply path fix for GitHub Pages
+    content = context["content"]
+    # MathJax is only loaded for pages that still contain TeX math
+    shell = fix_paths(render_template(template_name, {"mathjax": needs_mathjax(content), **context, "content": marker}))
+    return inline_critical_css(shell.replace(marker, content, 1))
+
+def render_post_nav(neighbours):
+    """Links to the newer and older post at the end of a post."""
+    parts = []
+    if neighbours.get("newer"):
+        parts.append(f"<a class='post-nav-newer' href='{neighbours['newer']['url']}'>&larr; Newer: {neighbours['newer']['title']}</a>")
+    if neighbours.get("older"):
+        parts.append(f"<a class='post-nav-older' href='{neighbours['older']['url']}'>Older: {neighbours['older']['title']} &rarr;</a>")
+    return f"<nav class='post-nav'>{''.join(parts)}</nav>" if parts else ""
+
+def post_neighbours(typ_files):
+    """
+    Maps each post source to its newer and older neighbour ({"title", "url"}) in
+    listing order, newest first with posts sharing a date in filename order.
+    """
+    entries = []
+    for typ_file in typ_files:
+        try:
+            metadata = load_metadata(typ_file)
+        except Exception:
+            # build_one reports the broken source when it gets to it
+            continue
+        entries.append((metadata.get("date_iso", metadata["date"]), typ_file, {"title": metadata["title"], "url": f"/blog/{typ_file.stem}/"}))
+    entries.sort(key=lambda entry: entry[0], reverse=True)
+    neighbours = {}
+    for i, (_, typ_file, _) in enumerate(entries):
+        neighbours[typ_file] = {
+            "newer": entries[i - 1][2] if i > 0 else None,
+            "older": entries[i + 1][2] if i + 1 < len(entries) else None,
+        }
+    return neighbours
+
+def build_post(typ_file, neighbours=None):
+    """
+    Compiles and renders one blog post. Returns its search terms, the other files it
+    links to, the digest of its compiled body and its entry for the posts list, or None
+    if it failed to compile.
+    `neighbours` are the newer and older posts linked (and prefetched) from its footer.
+    """
+    neighbours = neighbours or {}
+    metadata = load_metadata(typ_file)
+    
+    # Compile to HTML or SVG
+    html_content, ok = compile_typst(typ_file, use_svg=USE_SVG_FOR_BLOG, use_typst_html=USE_TYPST_HTML_FOR_BLOG)
+    if not ok or not html_content:
+        # Nothing is written or recorded, so the next build compiles (and reports) it again
+        return None
         
-        # Apply path fix for GitHub Pages
-        final_html = fix_paths(final_html)
+    slug = typ_file.stem
+    
+    context = {
+        "title": metadata["title"],
+        "date": metadata["date"],
+        "content": html_content,
+        "show_title": True,
+        "post_nav": render_post_nav(neighbours),
+        "hints": prefetch_hints(post["url"] for post in (neighbours.get("newer"), neighbours.get("older")) if post),
+    }
+    
+    final_html = render_page("post.html", context)
+    
+    write_output(f"blog/{slug}/index.html", final_html)
+    resources = publish_svg_resources(html_content)
+    
+    # Terms for the full-text search index, kept in the build manifest so
+    # unchanged posts don't have to be recompiled to rebuild the index
+    terms = sorted(search_terms(f"{metadata['title']} {metadata.get('abstract') or ''}") | search_terms(body_text(html_content)))
         
-        with open(post_dir / "index.html", "w", encoding="utf-8") as f:
-            f.write(final_html)
+    body = hashlib.sha256(html_content.encode("utf-8")).hexdigest()[:16]
+    return terms, resources, body, {
+        "title": metadata["title"], 
+        "url": f"/blog/{slug}/", 
+        "date": metadata["date"],
+        "date_iso": metadata.get("date_iso", metadata["date"]),
+        "tags": metadata.get("tags", []),
+        "abstract": metadata.get("abstract"),
+        "slug": slug
+    }
+
+def build_blog(jobs=None):
+    """
+    Builds every post concurrently with at most `jobs` workers (defaults to BUILD_JOBS,
+    then the CPU count). The returned posts list is ordered by filename regardless of
+    which worker finishes first. Posts whose inputs are unchanged since the last build
+    are not rebuilt at all.
+    """
+    typ_files = sorted(BLOG_DIR.glob("*.typ"))
+    jobs = jobs or BUILD_JOBS or os.cpu_count() or 1
+    # Metadata comes from the persisted index, so this doesn't open unchanged sources
+    neighbours = post_neighbours(typ_files)
+    
+    def build_one(typ_file):
+        rel_path = f"blog/{typ_file.stem}/index.html"
+        _current.source = typ_file
+        try:
+            inputs, deps = source_inputs(typ_file, rel_path, ["post.html", "base.html"], neighbours=neighbours.get(typ_file, {}))
+            record = reuse_output(rel_path, inputs)
+            if record:
+                return record["post"]
             
-        posts.append({
-            "title": metadata["title"], 
-            "url": f"/blog/{slug}/", 
-            "date": metadata["date"],
-            "date_iso": metadata.get("date_iso", metadata["date"]),
-            "tags": metadata.get("tags", []),
-            "abstract": metadata.get("abstract"),
-            "slug": slug
-        })
-        
+            log(f"Building {typ_file}")
+            with span("build_post"):
+                built = build_post(typ_file, neighbours.get(typ_file))
+            if not built:
+                return None
+            terms, resources, body, post = built
+            record_output(rel_path, inputs, deps=deps, post=post, terms=terms, resources=resources, body=body)
+            return post
+        except BuildAborted:
+            return None
+        except Exception as e:
+            record_failure(f"Error building post: {e!r}", typ_file)
+            return None
+        finally:
+            _current.source = None
+    
+    # Threads are enough here, the heavy lifting happens in typst/pandoc subprocesses
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = pool.map(build_one, typ_files)
+        posts = [post for post in results if post]
+    
     return posts
 
 def build_index(posts):
+    # Newest first; posts sharing a date keep their filename order
+    posts = sorted(posts, key=lambda post: post["date_iso"], reverse=True)
+    build_home()
+    build_blog_index(posts)
+    build_search_index(posts)
+
+def build_home():
     # Build Home Page from home.typ
     home_typ = PAGES_DIR / "home.typ"
     if home_typ.exists():
-        html_content = compile_typst(home_typ, use_svg=USE_SVG_FOR_PAGES, use_typst_html=USE_TYPST_HTML_FOR_PAGES, skip_toc=True)
-        
-        # Promote headings for home page: h2 -> h1, h3 -> h2, etc.
-        # Typst HTML export seems to demote the top-level heading to h2 by default
-        def promote_heading(match):
-            tag_open = match.group(1) # "" or "/"
-            level = int(match.group(2))
-            return f"<{tag_open}h{max(level - 1, 1)}"
-            
-        html_content = re.sub(r'<(/?)h([2-6])', promote_heading, html_content)
-        
-        context = {
-            "title": "", # No title for home
-            "date": "",
-            "content": html_content,
-            "show_title": False # Home page has its own heading in Typst
-        }
-        # Use post template for consistency or base? Post has the article wrapper.
-        html = render_template("post.html", context)
-        
-        # Apply path fix for GitHub Pages
-        html = fix_paths(html)
-        
-        with open(OUTPUT_DIR / "index.html", "w") as f:
-            f.write(html)
+        inputs, deps = source_inputs(home_typ, "index.html", ["post.html", "base.html"])
+        if reuse_output("index.html", inputs):
+            return
+        with span("build_home", file=str(home_typ)):
+            render_home(home_typ, inputs, deps)
     else:
         # Fallback
+        inputs = input_digests([home_typ, TEMPLATES_DIR / "base.html"], assets=asset_digest())
+        if reuse_output("index.html", inputs):
+            return
         context = {
             "title": "Home",
             "content": "<h1>Welcome</h1>"
         }
-        html = render_template("base.html", context)
-        with open(OUTPUT_DIR / "index.html", "w") as f:
-            f.write(html)
+        html = inline_critical_css(render_template("base.html", context))
+        write_output("index.html", html)
+        record_output("index.html", inputs)
 
-    # Build Blog Index with search and tags
-    post_list = "<ul class='post-list'>"
-    all_tags = set()
+def render_home(home_typ, inputs, deps):
+    """Compiles home.typ and writes output/index.html."""
+    # Promote headings for home page: h2 -> h1, h3 -> h2, etc.
+    # Typst HTML export seems to demote the top-level heading to h2 by default
+    html_content, ok = compile_typst(
+        home_typ,
+        use_svg=USE_SVG_FOR_PAGES,
+        use_typst_html=USE_TYPST_HTML_FOR_PAGES,
+        skip_toc=True,
+        promote_headings=True
+    )
+    if not ok:
+        # Keep whatever home page the last good build left, unrecorded so it's retried
+        _kept_outputs.add("index.html")
+        _kept_outputs.update(_previous_outputs.get("index.html", {}).get("resources", []))
+        return
+    
+    context = {
+        "title": "", # No title for home
+        "date": "",
+        "content": html_content or "",
+        "show_title": False # Home page has its own heading in Typst
+    }
+    # Use post template for consistency or base? Post has the article wrapper.
+    html = render_page("post.html", context)
     
+    write_output("index.html", html)
+    record_output("index.html", inputs, deps=deps, resources=publish_svg_resources(html_content or ""))
+
+def body_text(html):
+    """Visible text of compiled HTML, without scripts, styles, math or the TOC."""
+    parts = []
+    nav_depth = 0
+    for token in tokenize_html(html):
+        if token.tag == "nav":
+            if token.kind == "start" and (nav_depth or 'id="TOC"' in token.text):
+                nav_depth += 1
+            elif token.kind == "end" and nav_depth:
+                nav_depth -= 1
+        elif token.kind == "text" and not nav_depth:
+            parts.append(token.text)
+    return html_lib.unescape(" ".join(parts))
+
+def search_terms(text):
+    """
+    Splits text into lowercase search terms. blog-search.js tokenizes queries the
+    same way: runs of letters and digits, at least two characters, no stopwords.
+    """
+    return {
+        term for term in re.findall(r'[^\W_]+', text.lower())
+        if len(term) > 1 and term not in SEARCH_STOPWORDS
+    }
+
+def shard_search_terms(postings):
+    """
+    Groups terms into shards keyed by term prefix. Shards start at one character and
+    are split by longer prefixes while they hold more than SEARCH_SHARD_MAX_TERMS terms.
+    """
+    shards = {}
+    pending = [("", sorted(postings))]
+    while pending:
+        prefix, terms = pending.pop()
+        groups = {}
+        for term in terms:
+            groups.setdefault(term[:len(prefix) + 1], []).append(term)
+        for key, group in groups.items():
+            # A term shorter than the prefix length can't be split any further
+            if len(group) > SEARCH_SHARD_MAX_TERMS and any(len(term) > len(key) for term in group):
+                pending.append((key, group))
+            else:
+                shards[key] = group
+    return shards
+
+def build_search_index(posts):
+    """
+    Writes the inverted full-text index to static/search/: docs.json lists the posts
+    (document IDs are positions in that list), each shard maps the terms starting with
+    its prefix to delta-encoded, sorted document IDs, and meta.json lists the shards so
+    blog-search.js can fetch only the ones a query needs.
+    """
+    post_terms = []
     for post in posts:
-        tags_html = ""
-        if post.get("tags"):
-            all_tags.update(post["tags"])
-            tags_html = " ".join([f"<span class='tag'>{tag}</span>" for tag in post["tags"]])
-        
-        abstract_html = ""
-        if post.get("abstract"):
-            abstract_html = f"<p class='post-abstract'>{post['abstract']}</p>"
-        
-        post_list += f"<li class='post-item' data-tags='{','.join(post.get('tags', []))}'>"
-        post_list += f"<div class='post-header'><a href='{post['url']}'>{post['title']}</a><span class='post-date'>{post['date']}</span></div>"
-        post_list += abstract_html
-        if tags_html:
-            post_list += f"<div class='post-tags'>{tags_html}</div>"
-        post_list += "</li>"
-    post_list += "</ul>"
-    
-    # Create tag filter buttons
-    tag_buttons = "<div class='tag-filter'><button class='tag-btn active' data-tag='all'>All</button>"
-    for tag in sorted(all_tags):
-        tag_buttons += f"<button class='tag-btn' data-tag='{tag}'>{tag}</button>"
-    tag_buttons += "</div>"
-    
-    # Create search box
+        record = _current_outputs.get(f"blog/{post['slug']}/index.html", {})
+        post_terms.append(record.get("terms", []))
+    
+    inputs = input_digests([], posts=posts, terms=post_terms)
+    previous = reuse_output(f"{SEARCH_DIR}/meta.json", inputs)
+    # Shards and docs are always written together with meta.json, from the same inputs
+    if previous and all(reuse_output(rel_path, inputs) for rel_path in previous["files"]):
+        return
+    
+    postings = {}
+    for doc_id, terms in enumerate(post_terms):
+        for term in terms:
+            postings.setdefault(term, []).append(doc_id)
+    
+    docs = [
+        [post["title"], BASE_URL + post["url"], post["date"], post.get("tags", []), post.get("abstract") or ""]
+        for post in posts
+    ]
+    docs_json = json.dumps(docs, separators=(",", ":"))
+    files = [f"{SEARCH_DIR}/docs.json"]
+    write_output(files[0], docs_json)
+    
+    shards = shard_search_terms(postings)
+    for prefix, terms in shards.items():
+        shard = {}
+        for term in terms:
+            previous = 0
+            deltas = []
+            for doc_id in postings[term]:
+                deltas.append(doc_id - previous)
+                previous = doc_id
+            shard[term] = deltas
+        files.append(f"{SEARCH_DIR}/shard-{prefix}.json")
+        write_output(files[-1], json.dumps(shard, separators=(",", ":"), ensure_ascii=False))
+    
+    # Clients cache docs.json and the shards by this version, so it covers both
+    version = hashlib.sha256(f"{inputs['terms']}\0{docs_json}".encode("utf-8")).hexdigest()[:12]
+    meta = {"version": version, "shards": sorted(shards), "docs": "docs.json"}
+    write_output(f"{SEARCH_DIR}/meta.json", json.dumps(meta, separators=(",", ":"), ensure_ascii=False))
+    for rel_path in files:
+        record_output(rel_path, inputs)
+    record_output(f"{SEARCH_DIR}/meta.json", inputs, files=files)
+
+# Tag -> URL slug for this build's tags, see assign_tag_slugs
+_tag_slugs = {}
+
+def _tag_digest(tag):
+    return hashlib.sha256(tag.encode("utf-8")).hexdigest()[:8]
+
+def assign_tag_slugs(tags):
+    """
+    Gives every tag a distinct slug. Tags whose slugs collide ("C++" and "C", "foo bar"
+    and "foo-bar") get a suffix from their own hash, except the one already written
+    like its slug (or else the first), so slugs don't move when other tags come and go.
+    """
+    groups = {}
+    for tag in sorted(tags):
+        groups.setdefault(slugify_heading(tag) or _tag_digest(tag), []).append(tag)
+    _tag_slugs.clear()
+    for slug, group in groups.items():
+        plain = next((tag for tag in group if tag == slug), group[0])
+        for tag in group:
+            _tag_slugs[tag] = slug if tag == plain else f"{slug}-{_tag_digest(tag)[:6]}"
+
+def tag_slug(tag):
+    return _tag_slugs.get(tag) or slugify_heading(tag) or _tag_digest(tag)
+
+def listing_url(base, page):
+    """URL of page `page` (1-based) of a post listing rooted at `base`, e.g. /blog/page/2/."""
+    return base if page == 1 else f"{base}page/{page}/"
+
+def render_post_item(post):
+    """The <li> for one post in a listing."""
+    parts = [
+        f"<li class='post-item' data-tags='{','.join(post.get('tags', []))}'>",
+        f"<div class='post-header'><a href='{post['url']}'>{post['title']}</a><span class='post-date'>{post['date']}</span></div>",
+    ]
+    if post.get("abstract"):
+        parts.append(f"<p class='post-abstract'>{post['abstract']}</p>")
+    if post.get("tags"):
+        tags_html = " ".join(f"<a class='tag' href='/blog/tags/{tag_slug(tag)}/'>{tag}</a>" for tag in post["tags"])
+        parts.append(f"<div class='post-tags'>{tags_html}</div>")
+    parts.append("</li>")
+    return "".join(parts)
+
+def render_pagination(base, page, page_count):
+    if page_count == 1:
+        return ""
+    parts = ["<nav class='pagination'>"]
+    if page > 1:
+        parts.append(f"<a class='pagination-newer' href='{listing_url(base, page - 1)}'>&larr; Newer</a>")
+    parts.append(f"<span class='pagination-status'>Page {page} of {page_count}</span>")
+    if page < page_count:
+        parts.append(f"<a class='pagination-older' href='{listing_url(base, page + 1)}'>Older &rarr;</a>")
+    parts.append("</nav>")
+    return "".join(parts)
+
+def build_listing(base, title, posts, tags, current_tag=None):
+    """
+    Writes the paginated listing of `posts` rooted at `base` (a URL path like /blog/).
+    Each page is rendered and written only if its own posts, the tag list or the
+    templates changed, so adding one post touches the pages it shifts and no others.
+    """
+    templates = [TEMPLATES_DIR / "blog_index.html", TEMPLATES_DIR / "base.html"]
+    page_size = max(1, BLOG_PAGE_SIZE)
+    page_count = max(1, -(-len(posts) // page_size))
+    
+    # Search box and tag links are shared by every page of the listing
     search_box = """<div class='search-box'>
         <input type='text' id='search-input' placeholder='Search posts...' />
     </div>"""
+    tag_links = ["<div class='tag-filter'>"]
+    all_class = "tag-btn" if current_tag else "tag-btn active"
+    tag_links.append(f"<a class='{all_class}' data-tag='all' href='/blog/'>All</a>")
+    for tag in tags:
+        tag_class = "tag-btn active" if tag == current_tag else "tag-btn"
+        tag_links.append(f"<a class='{tag_class}' data-tag='{tag}' href='/blog/tags/{tag_slug(tag)}/'>{tag}</a>")
+    tag_links.append("</div>")
+    tag_filter = "".join(tag_links)
     
-    blog_content = f"""<h1>Blog</h1>
+    for page in range(1, page_count + 1):
+        page_posts = posts[(page - 1) * page_size:page * page_size]
+        rel_path = listing_url(base, page).lstrip("/") + "index.html"
+        inputs = input_digests(templates, title=title, posts=page_posts, tags=tags, current_tag=current_tag or "", page=f"{page}/{page_count}", assets=asset_digest())
+        if reuse_output(rel_path, inputs):
+            continue
+        
+        post_list = "<ul class='post-list'>" + "".join(map(render_post_item, page_posts)) + "</ul>"
+        heading = title if page == 1 else f"{title} (page {page})"
+        blog_content = f"""<h1>{title}</h1>
     {search_box}
-    {tag_buttons}
+    {tag_filter}
+    <ul class='post-list' id='search-results' hidden></ul>
     {post_list}
+    {render_pagination(base, page, page_count)}
     <script src='/static/js/blog-search.js'></script>"""
-    
-    with open(TEMPLATES_DIR / "base.html", "r") as f:
-        base = f.read()
+        
+        # The first posts on the page are the likeliest next navigation
+        hints = prefetch_hints(post["url"] for post in page_posts[:PREFETCH_POSTS])
+        page_html = render_template("blog_index.html", {"title": heading, "content": blog_content, "hints": hints})
+        
+        # Apply path fix for GitHub Pages
+        page_html = inline_critical_css(fix_paths(page_html))
+        
+        write_output(rel_path, page_html)
+        record_output(rel_path, inputs)
 
-    blog_index_html = base.replace("{% block content %}{% endblock %}", blog_content)
-    blog_index_html = blog_index_html.replace("{% block title %}My Math Website{% endblock %}", "Blog")
-    
-    # Apply path fix for GitHub Pages
-    blog_index_html = fix_paths(blog_index_html)
-    
-    with open(OUTPUT_DIR / "blog" / "index.html", "w") as f:
-        f.write(blog_index_html)
-    
-    # Create search index JSON
-    search_index = []
+def build_blog_index(posts):
+    """
+    Builds the paginated blog index and one paginated listing per tag under /blog/tags/<tag>/.
+    `posts` must already be sorted newest first.
+    """
+    posts_by_tag = {}
     for post in posts:
-        search_index.append({
-            "title": post["title"],
-            "url": post["url"],
-            "date": post["date"],
-            "tags": post.get("tags", []),
-            "slug": post["slug"]
-        })
-    
-    import json
-    with open(OUTPUT_DIR / "static" / "search-index.json", "w") as f:
-        json.dump(search_index, f)
+        for tag in post.get("tags", []):
+            posts_by_tag.setdefault(tag, []).append(post)
+    tags = sorted(posts_by_tag)
+    assign_tag_slugs(tags)
+    
+    build_listing("/blog/", "Blog", posts, tags)
+    for tag in tags:
+        build_listing(f"/blog/tags/{tag_slug(tag)}/", f"Posts tagged &ldquo;{tag}&rdquo;", posts_by_tag[tag], tags, current_tag=tag)
 
 def build_pages():
     PAGES_DIR.mkdir(exist_ok=True)
     for typ_file in PAGES_DIR.glob("*.typ"):
-        with open(typ_file, "r", encoding="utf-8") as f:
-            raw_content = f.read()
-            
-        metadata = parse_metadata(raw_content)
-        html_content = compile_typst(typ_file)
+        metadata = load_metadata(typ_file)
+        html_content, ok = compile_typst(typ_file)
         
-        if not html_content:
+        if not ok or not html_content:
             continue
             
-        body_match = re.search(r'<body.*?>(.*?)</body>', html_content, re.DOTALL)
-        if body_match:
-            html_content = body_match.group(1)
-            
         slug = typ_file.stem
         # Pages go to root or their own folder? Let's do root/slug/index.html
         page_dir = OUTPUT_DIR / slug
@@ -624,19 +2822,646 @@ def build_pages():
         }
         
         # Use a generic page template or post template? Let's use post.html for now as it's generic enough
-        final_html = render_template("post.html", context)
+        final_html = render_page("post.html", context)
         
         with open(page_dir / "index.html", "w", encoding="utf-8") as f:
             f.write(final_html)
 
-def main():
-    print("Building site...")
-    clean_output()
-    copy_static()
-    posts = build_blog()
-    # build_pages() # We are handling home manually and don't need other pages for now
-    build_index(posts)
-    print("Build complete.")
+FEED_PATH = "feed.xml"
+SITEMAP_PATH = "sitemap.xml"
+
+def site_url(rel_path):
+    """Absolute URL of an output file on the deployed site (SITE_URL plus BASE_URL)."""
+    return SITE_URL.rstrip("/") + output_url(rel_path)
+
+def page_lastmod(rel_path, previous_files):
+    """
+    Last-modified time of an output as an RFC 3339 UTC timestamp. A file byte-identical
+    to the one in the last build's output manifest keeps that build's mtime (which
+    write_output_manifest restores), so it only moves when the content does.
+    """
+    path = OUTPUT_DIR / rel_path
+    old = previous_files.get(rel_path)
+    if old and "mtime_ns" in old and old["sha256"] == file_digest(path):
+        mtime_ns = old["mtime_ns"]
+    else:
+        mtime_ns = path.stat().st_mtime_ns
+    return datetime.fromtimestamp(mtime_ns // 1_000_000_000, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def rfc3339_date(date_iso):
+    """A post's date_iso as an RFC 3339 timestamp, bare dates taken as midnight UTC."""
+    return f"{date_iso}T00:00:00Z" if len(date_iso) == 10 else date_iso
+
+def xml_element(writer, name, text=None, **attributes):
+    writer.startElement(name, attributes)
+    if text is not None:
+        writer.characters(text)
+    writer.endElement(name)
+
+def write_atom_feed(stream, posts, lastmod, updated):
+    """Streams the Atom feed of `posts` (newest first, `lastmod` keyed by URL) into `stream`."""
+    writer = XMLGenerator(stream, encoding="utf-8", short_empty_elements=True)
+    writer.startDocument()
+    writer.startElement("feed", {"xmlns": "http://www.w3.org/2005/Atom"})
+    xml_element(writer, "id", site_url("index.html"))
+    xml_element(writer, "title", FEED_TITLE)
+    xml_element(writer, "link", rel="self", href=site_url(FEED_PATH))
+    xml_element(writer, "link", href=site_url("index.html"))
+    xml_element(writer, "updated", updated)
+    writer.startElement("author", {})
+    xml_element(writer, "name", FEED_TITLE)
+    writer.endElement("author")
+    for post in posts:
+        rel_path = post["url"].lstrip("/") + "index.html"
+        writer.startElement("entry", {})
+        xml_element(writer, "id", site_url(rel_path))
+        xml_element(writer, "title", html_lib.unescape(post["title"]))
+        xml_element(writer, "link", href=site_url(rel_path))
+        xml_element(writer, "published", rfc3339_date(post["date_iso"]))
+        xml_element(writer, "updated", lastmod[post["url"]])
+        for tag in post.get("tags", []):
+            xml_element(writer, "category", term=tag)
+        if post.get("abstract"):
+            xml_element(writer, "summary", html_lib.unescape(post["abstract"]))
+        writer.endElement("entry")
+    writer.endElement("feed")
+    writer.endDocument()
+
+def write_sitemap(stream, lastmod):
+    """Streams a sitemap of the pages in `lastmod` (output path -> timestamp) into `stream`."""
+    writer = XMLGenerator(stream, encoding="utf-8", short_empty_elements=True)
+    writer.startDocument()
+    writer.startElement("urlset", {"xmlns": "http://www.sitemaps.org/schemas/sitemap/0.9"})
+    for rel_path, timestamp in lastmod.items():
+        writer.startElement("url", {})
+        xml_element(writer, "loc", site_url(rel_path))
+        xml_element(writer, "lastmod", timestamp)
+        writer.endElement("url")
+    writer.endElement("urlset")
+    writer.endDocument()
+
+def entry_updated(rel_path, body, lastmod, previous_files):
+    """
+    Atom `updated` time of a post: kept from the previous output manifest while the
+    compiled body is unchanged, so edits to the page around it (e.g. the links to its
+    neighbours when a new post comes out) don't count as an update.
+    """
+    old = previous_files.get(rel_path, {})
+    if body and old.get("body") == body and "updated" in old:
+        return old["updated"]
+    return lastmod
+
+def build_feeds(posts, previous_files):
+    """
+    Writes the Atom feed of all posts and a sitemap of every page this build produced.
+    Each page's lastmod follows its content hash, and each feed entry's updated time the
+    hash of the post's compiled body. Both files are only rewritten when a post's metadata
+    or some page's content changed. Returns the body hashes and updated times to keep
+    in the output manifest for the next build.
+    """
+    posts = sorted(posts, key=lambda post: post["date_iso"], reverse=True)
+    pages = sorted(rel_path for rel_path in _current_outputs if rel_path == "index.html" or rel_path.endswith("/index.html"))
+    lastmod = {rel_path: page_lastmod(rel_path, previous_files) for rel_path in pages}
+    annotations = {}
+    post_lastmod = {}
+    for post in posts:
+        rel_path = post["url"].lstrip("/") + "index.html"
+        body = _current_outputs[rel_path].get("body")
+        post_lastmod[post["url"]] = entry_updated(rel_path, body, lastmod[rel_path], previous_files)
+        annotations[rel_path] = {"body": body, "updated": post_lastmod[post["url"]]}
+    # The feed is as new as its most recently changed entry
+    updated = max(post_lastmod.values(), default=lastmod.get("index.html", "1970-01-01T00:00:00Z"))
+    
+    inputs = input_digests([], posts=posts, lastmod=lastmod, updated=post_lastmod, site=SITE_URL, title=FEED_TITLE)
+    for rel_path, write in ((FEED_PATH, lambda stream: write_atom_feed(stream, posts, post_lastmod, updated)),
+                            (SITEMAP_PATH, lambda stream: write_sitemap(stream, lastmod))):
+        if reuse_output(rel_path, inputs):
+            continue
+        stream = io.StringIO()
+        write(stream)
+        write_output(rel_path, stream.getvalue())
+        record_output(rel_path, inputs)
+    return annotations
+
+# Shell files precached by the service worker on install (besides fingerprinted assets)
+SERVICE_WORKER_SHELL = ("index.html", "blog/index.html", f"{SEARCH_DIR}/meta.json", f"{SEARCH_DIR}/docs.json")
+
+def output_url(rel_path):
+    """The URL an output file is served at, directory URLs for index.html pages."""
+    if rel_path == "index.html" or rel_path.endswith("/index.html"):
+        rel_path = rel_path[:-len("index.html")]
+    return fix_url(f"/{rel_path}")
+
+def build_service_worker():
+    """
+    Writes output/sw.js from templates/sw.js with the URL and content hash of every output:
+    the shell (SERVICE_WORKER_SHELL and the fingerprinted assets) to precache, everything
+    else to cache on first use. Precompressed siblings aren't listed, hosts serve them
+    for the original URLs.
+    """
+    assets = {hashed.lstrip("/") for hashed in _asset_urls.values()}
+    precache = {}
+    pages = {}
+    for rel_path in sorted(_current_outputs):
+        if rel_path == "sw.js" or rel_path.endswith((".gz", ".zst")):
+            continue
+        entries = precache if rel_path in SERVICE_WORKER_SHELL or rel_path in assets else pages
+        entries[output_url(rel_path)] = file_digest(OUTPUT_DIR / rel_path)[:16]
+    
+    script = render_template("sw.js", {
+        "precache": json.dumps(precache, indent=1),
+        "pages": json.dumps(pages, indent=1),
+    })
+    write_output("sw.js", script)
+    record_output("sw.js", input_digests([TEMPLATES_DIR / "sw.js"], script=hashlib.sha256(script.encode("utf-8")).hexdigest()))
+
+# Served as sw.js by `build.py serve` instead of the real worker: it drops the caches of a
+# worker an earlier visit installed and unregisters, so pages always come fresh from disk
+DEV_SERVICE_WORKER = """self.addEventListener('install', () => self.skipWaiting());
+self.addEventListener('activate', event => event.waitUntil(
+    caches.keys()
+        .then(keys => Promise.all(keys.map(key => caches.delete(key))))
+        .then(() => self.registration.unregister())
+));
+"""
+
+# Directories watched by `build.py serve`
+WATCH_DIRS = [CONTENT_DIR, TEMPLATES_DIR, INTERACTIVE_DIR, STATIC_DIR]
+LIVE_RELOAD_PATH = "/__livereload"
+LIVE_RELOAD_SCRIPT = f"""<script>
+new EventSource("{LIVE_RELOAD_PATH}").onmessage = function () {{ location.reload(); }};
+</script>"""
+
+# Bumped after every rebuild in serve mode, live reload clients wait on it
+_reload_generation = 0
+_reload_condition = threading.Condition()
+
+def notify_reload():
+    global _reload_generation
+    with _reload_condition:
+        _reload_generation += 1
+        _reload_condition.notify_all()
+
+class DevRequestHandler(SimpleHTTPRequestHandler):
+    """Serves output/ with a live reload script injected into every HTML page."""
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def translate_path(self, path):
+        # Pages link to BASE_URL-prefixed paths, serve them from the output root
+        if BASE_URL and path.startswith(BASE_URL):
+            path = path[len(BASE_URL):] or "/"
+        return super().translate_path(path)
+    
+    def do_GET(self):
+        if self.path == LIVE_RELOAD_PATH:
+            return self.stream_reloads()
+        
+        path = self.translate_path(self.path)
+        if path == os.path.join(self.directory, "sw.js"):
+            return self.send_text(DEV_SERVICE_WORKER, "text/javascript")
+        if os.path.isdir(path):
+            if not self.path.split("?")[0].endswith("/"):
+                # Let the base class redirect to the trailing-slash URL
+                return super().do_GET()
+            path = os.path.join(path, "index.html")
+        if not (path.endswith(".html") and os.path.isfile(path)):
+            return super().do_GET()
+        
+        with open(path, "r", encoding="utf-8") as f:
+            html = f.read()
+        if "</body>" in html:
+            html = html.replace("</body>", LIVE_RELOAD_SCRIPT + "</body>", 1)
+        else:
+            html += LIVE_RELOAD_SCRIPT
+        self.send_text(html, "text/html")
+    
+    def send_text(self, text, content_type):
+        body = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def stream_reloads(self):
+        """Server-sent events stream that emits one message per rebuild."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        
+        with _reload_condition:
+            seen = _reload_generation
+        try:
+            while True:
+                with _reload_condition:
+                    _reload_condition.wait_for(lambda: _reload_generation != seen, timeout=15)
+                    generation = _reload_generation
+                if generation != seen:
+                    seen = generation
+                    self.wfile.write(b"data: reload\n\n")
+                else:
+                    # Heartbeat, also detects closed tabs
+                    self.wfile.write(b": ping\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+def snapshot_sources():
+    """Maps every watched file to its (mtime, size)."""
+    snapshot = {}
+    for root in WATCH_DIRS:
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+def watch_and_rebuild(args, interval=0.3, debounce=0.2):
+    """Polls the watched directories and rebuilds once per burst of changes."""
+    snapshot = snapshot_sources()
+    while True:
+        time.sleep(interval)
+        current = snapshot_sources()
+        if current == snapshot:
+            continue
+        
+        # Wait for a save storm to settle so it triggers a single rebuild
+        while True:
+            time.sleep(debounce)
+            settled = snapshot_sources()
+            if settled == current:
+                break
+            current = settled
+        
+        changed = sorted(path for path in set(snapshot) | set(current) if snapshot.get(path) != current.get(path))
+        snapshot = current
+        log(f"\nChanged: {', '.join(changed[:5])}{' ...' if len(changed) > 5 else ''}")
+        
+        try:
+            build_site(args)
+        except Exception:
+            traceback.print_exc()
+        notify_reload()
+
+def serve(args):
+    """Builds the site, serves output/ and rebuilds on changes with live reload."""
+    build_site(args)
+    # Later rebuilds are always incremental
+    args.clean = False
+    
+    handler = partial(DevRequestHandler, directory=str(OUTPUT_DIR))
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving at http://{args.host}:{args.port}{BASE_URL}/ (Ctrl+C to stop)")
+    
+    try:
+        watch_and_rebuild(args)
+    except KeyboardInterrupt:
+        print("\nStopping server.")
+    finally:
+        server.shutdown()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the static site into output/.")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="build",
+        choices=["build", "serve", "diff", "vendor"],
+        help="'build' (default) builds once, 'serve' also serves output/ and rebuilds on changes, "
+             "'diff' compares output manifests, 'vendor' pins Typst packages and fonts into vendor/"
+    )
+    parser.add_argument(
+        "manifests",
+        nargs="*",
+        metavar="MANIFEST",
+        help="for 'diff': the old output manifest (path or URL) and optionally the new one (default: output/.manifest.json)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="ignore the compile cache in .cache/ and recompile every source (implies --clean)"
+    )
+    parser.add_argument(
+        "--previous-manifest",
+        metavar="MANIFEST",
+        help="output manifest (path or URL, e.g. the deployed site's) to use when output/ has none, "
+             "so unchanged files keep their mtime and feed/sitemap dates"
+    )
+    parser.add_argument(
+        "--clean",
+        action="store_true",
+        help="wipe output/ and rebuild every page instead of only the ones whose inputs changed"
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="number of posts to compile in parallel (default: BUILD_JOBS or the CPU count)"
+    )
+    parser.add_argument(
+        "--no-compress",
+        dest="compress",
+        action="store_false",
+        help="don't write precompressed .gz/.zst siblings of text outputs"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="kill any typst/pandoc run after this long (default: TOOL_TIMEOUT, 0 = no limit)"
+    )
+    parser.add_argument(
+        "--max-failures",
+        type=int,
+        default=None,
+        metavar="N",
+        help="abort the build once more than N compiles failed (default: MAX_FAILURES, unlimited)"
+    )
+    parser.add_argument(
+        "--fail-fast",
+        dest="max_failures",
+        action="store_const",
+        const=0,
+        help="abort the build at the first failed compile (same as --max-failures 0)"
+    )
+    parser.add_argument(
+        "--trace",
+        nargs="?",
+        const="build-trace.json",
+        default=None,
+        metavar="PATH",
+        help="record spans for every stage and subprocess as Chrome trace JSON (default: build-trace.json) and print a summary"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="address for 'serve' to bind to")
+    parser.add_argument("--port", type=int, default=8080, help="port for 'serve' to listen on")
+    return parser.parse_args(argv)
+
+def build_site(args):
+    """Builds the site. Returns False if the build was aborted by the failure budget."""
+    global USE_COMPILE_CACHE, TRACE_ENABLED, TOOL_TIMEOUT, MAX_FAILURES, _pandoc_server_attempted
+    USE_COMPILE_CACHE = not args.no_cache
+    TRACE_ENABLED = bool(args.trace)
+    if args.timeout is not None:
+        TOOL_TIMEOUT = args.timeout or None
+    if args.max_failures is not None:
+        MAX_FAILURES = args.max_failures
+    _trace_events.clear()
+    _aborted.clear()
+    # Each build (e.g. every rebuild under serve) gets one try at starting the pandoc server
+    _pandoc_server_attempted = False
+    
+    log("Building site...")
+    aborted = False
+    try:
+        with span("build"):
+            # Read before clean_output can wipe it
+            previous_files = load_output_manifest()
+            if not previous_files and args.previous_manifest:
+                # A fresh checkout (CI) has no output/, start from the deployed site's manifest
+                previous_files = load_output_manifest(args.previous_manifest)
+                if not previous_files:
+                    log(f"Warning: couldn't read {args.previous_manifest}, every file counts as new")
+            with span("load_build_manifest"):
+                # Reusing pages would skip the compiles --no-cache asks for
+                incremental = load_build_manifest(clean=args.clean or args.no_cache)
+            if not incremental:
+                with span("clean_output"):
+                    clean_output()
+            with span("build_assets"):
+                build_assets()
+            with span("build_blog"):
+                posts = build_blog(jobs=args.jobs)
+            check_failure_budget()
+            # build_pages() # We are handling home manually and don't need other pages for now
+            with span("build_index"):
+                build_index(posts)
+            check_failure_budget()
+            with span("build_feeds"):
+                annotations = build_feeds(posts, previous_files)
+            with span("build_service_worker"):
+                build_service_worker()
+            if args.compress:
+                with span("precompress_outputs"):
+                    precompress_outputs(jobs=args.jobs)
+            with span("remove_stale_outputs"):
+                removed = remove_stale_outputs()
+            if removed:
+                log(f"Removed {removed} stale output file(s)")
+            with span("write_output_manifest"):
+                write_output_manifest(previous_files, annotations)
+            with span("save_build_manifest"):
+                save_build_manifest()
+                prune_metadata_index(BLOG_DIR.glob("*.typ"))
+                save_metadata_index()
+            if USE_COMPILE_CACHE:
+                with span("prune_compile_cache"):
+                    prune_compile_cache()
+    except BuildAborted:
+        # Nothing is recorded, the next build picks up where this one stopped
+        aborted = True
+    finally:
+        stop_pandoc_server()
+    
+    failures = report_failures()
+    report_slow_tools()
+    if TRACE_ENABLED:
+        write_trace(args.trace)
+        print_trace_summary()
+        print(f"\nTrace written to {args.trace}")
+    if aborted:
+        log(f"Build aborted after {failures} failure(s) (failure budget: {MAX_FAILURES}).")
+        return False
+    log("Build complete." if not failures else f"Build complete with {failures} failure(s).")
+    return True
+
+# Package imports such as "@preview/cetz:0.3.2"
+_PACKAGE_IMPORT = re.compile(r'"@([a-z0-9-]+)/([A-Za-z0-9_-]+):(\d+\.\d+\.\d+)"')
+# Font families named in text(font: ...) and set rules
+_FONT_ARGUMENT = re.compile(r'\bfont\s*:\s*(\([^)]*\)|"[^"]*")')
+TYPST_PACKAGE_REGISTRY = "https://packages.typst.org"
+# Fonts that ship inside the typst binary, nothing to vendor for them
+TYPST_EMBEDDED_FONTS = {"libertinus serif", "new computer modern", "new computer modern math", "dejavu sans mono"}
+FONT_SUFFIXES = (".ttf", ".otf", ".ttc", ".otc")
+SYSTEM_FONT_DIRS = [
+    "/usr/share/fonts", "/usr/local/share/fonts", "~/.local/share/fonts", "~/.fonts",
+    "/Library/Fonts", "/System/Library/Fonts", "~/Library/Fonts",
+    os.path.join(os.environ.get("WINDIR", "C:/Windows"), "Fonts"),
+]
+
+def read_vendor_lock():
+    try:
+        return json.loads(VENDOR_LOCK.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def package_imports(paths):
+    """(namespace, name, version) of every package the Typst files in `paths` import."""
+    specs = set()
+    for path in paths:
+        specs.update(_PACKAGE_IMPORT.findall(Path(path).read_text(encoding="utf-8", errors="replace")))
+    return specs
+
+def font_families_used(paths):
+    """Lowercased font families the Typst files in `paths` ask for."""
+    families = set()
+    for path in paths:
+        for argument in _FONT_ARGUMENT.findall(Path(path).read_text(encoding="utf-8", errors="replace")):
+            families.update(name.lower() for name in re.findall(r'"([^"]+)"', argument))
+    return families
+
+def typst_package_dirs():
+    """Where typst keeps downloaded and local packages on this machine, if anywhere."""
+    if sys.platform == "darwin":
+        data, cache = Path("~/Library/Application Support").expanduser(), Path("~/Library/Caches").expanduser()
+    elif os.name == "nt":
+        data = cache = Path(os.environ.get("LOCALAPPDATA", "~")).expanduser()
+    else:
+        data = Path(os.environ.get("XDG_DATA_HOME", "~/.local/share")).expanduser()
+        cache = Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser()
+    return [data / "typst" / "packages", cache / "typst" / "packages"]
+
+def fetch_typst_package(namespace, name, version, dest):
+    """Copies a package from typst's local directories, or downloads it from the registry."""
+    temp = dest.with_name(f"{version}.{os.getpid()}.tmp")
+    shutil.rmtree(temp, ignore_errors=True)
+    for directory in typst_package_dirs():
+        if (directory / namespace / name / version / "typst.toml").exists():
+            shutil.copytree(directory / namespace / name / version, temp)
+            break
+    else:
+        if namespace != "preview":
+            raise ValueError(f"@{namespace}/{name}:{version} is not in any local package directory")
+        url = f"{TYPST_PACKAGE_REGISTRY}/preview/{name}-{version}.tar.gz"
+        with urllib.request.urlopen(url, timeout=60) as response:
+            data = response.read()
+        with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as archive:
+            # The data filter refuses absolute paths and links out of the package
+            archive.extractall(temp, **({"filter": "data"} if hasattr(tarfile, "data_filter") else {}))
+    os.replace(temp, dest)
+
+def font_families(path):
+    """Lowercased family names (name IDs 1 and 16) in a TrueType/OpenType font or collection."""
+    try:
+        data = Path(path).read_bytes()
+        offsets = [0]
+        if data[:4] == b"ttcf":
+            count = struct.unpack(">I", data[8:12])[0]
+            offsets = struct.unpack(f">{count}I", data[12:12 + 4 * count])
+        families = set()
+        for offset in offsets:
+            tables = struct.unpack(">H", data[offset + 4:offset + 6])[0]
+            for index in range(tables):
+                entry = offset + 12 + 16 * index
+                tag, _, table, _ = struct.unpack(">4sIII", data[entry:entry + 16])
+                if tag != b"name":
+                    continue
+                _, records, strings = struct.unpack(">HHH", data[table:table + 6])
+                for record in range(records):
+                    start = table + 6 + 12 * record
+                    platform, _, _, name_id, length, position = struct.unpack(">6H", data[start:start + 12])
+                    if name_id in (1, 16):
+                        raw = data[table + strings + position:table + strings + position + length]
+                        # Windows and Unicode platform names are UTF-16, Mac ones are single-byte
+                        families.add((raw.decode("utf-16-be", "ignore") if platform in (0, 3) else raw.decode("latin-1")).lower())
+        return families
+    except (OSError, struct.error):
+        return set()
+
+def vendor(args):
+    """
+    Resolves every Typst package imported under content/ (and the packages those import)
+    into vendor/typst-packages/, copies the fonts the sources ask for into vendor/fonts/
+    and writes vendor/typst.lock.json. From then on every compile uses only these packages
+    and fonts (plus the ones built into typst), so builds are reproducible and offline.
+    """
+    sources = sorted(CONTENT_DIR.rglob("*.typ"))
+    resolved = set()
+    pending = package_imports(sources)
+    while pending:
+        spec = pending.pop()
+        resolved.add(spec)
+        dest = VENDOR_PACKAGES.joinpath(*spec)
+        if not dest.is_dir():
+            log(f"Vendoring @{spec[0]}/{spec[1]}:{spec[2]}")
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                fetch_typst_package(*spec, dest)
+            except (OSError, ValueError, tarfile.TarError) as e:
+                raise SystemExit(f"Could not vendor @{spec[0]}/{spec[1]}:{spec[2]}: {e}")
+        pending |= package_imports(dest.rglob("*.typ")) - resolved
+    
+    # Drop packages nothing imports anymore
+    for directory in sorted(VENDOR_PACKAGES.glob("*/*/*")):
+        if tuple(directory.relative_to(VENDOR_PACKAGES).parts) not in resolved:
+            log(f"Removing {directory}")
+            shutil.rmtree(directory)
+    
+    package_sources = [path for spec in resolved for path in VENDOR_PACKAGES.joinpath(*spec).rglob("*.typ")]
+    wanted = font_families_used(sources + package_sources) - TYPST_EMBEDDED_FONTS
+    fonts = {}
+    for root in [VENDOR_FONTS] + [Path(directory).expanduser() for directory in SYSTEM_FONT_DIRS]:
+        if not root.is_dir():
+            continue
+        for path in sorted(root.rglob("*")):
+            if path.suffix.lower() in FONT_SUFFIXES and path.name not in fonts and font_families(path) & wanted:
+                fonts[path.name] = path
+    found = set().union(*(font_families(path) for path in fonts.values()))
+    for family in sorted(wanted - found):
+        log(f"Warning: font \"{family}\" is used but wasn't found, vendored builds will fall back to typst's fonts")
+    
+    VENDOR_FONTS.mkdir(parents=True, exist_ok=True)
+    for name, path in fonts.items():
+        if path.parent != VENDOR_FONTS:
+            shutil.copy2(path, VENDOR_FONTS / name)
+    for path in VENDOR_FONTS.iterdir():
+        if path.name not in fonts:
+            path.unlink()
+    
+    version = run_tool(["typst", "--version"], capture_output=True, text=True, check=True).stdout.strip()
+    lock = {
+        "version": VENDOR_LOCK_VERSION,
+        "typst": version,
+        "packages": [f"@{namespace}/{name}:{ver}" for namespace, name, ver in sorted(resolved)],
+        "fonts": {name: file_digest(VENDOR_FONTS / name) for name in sorted(fonts)},
+    }
+    VENDOR_LOCK.write_text(json.dumps(lock, indent=1) + "\n", encoding="utf-8")
+    log(f"Vendored {len(resolved)} package(s) and {len(fonts)} font file(s) for {version}")
+
+def diff(args):
+    """Prints the paths added (A), changed (M) and removed (D) between two output manifests."""
+    if not 1 <= len(args.manifests) <= 2:
+        raise SystemExit("usage: build.py diff OLD_MANIFEST [NEW_MANIFEST]")
+    # Both are named explicitly (or are this build's), a missing one is an error, not "empty"
+    old = load_output_manifest(args.manifests[0], missing_ok=False)
+    new = load_output_manifest(args.manifests[1] if len(args.manifests) == 2 else OUTPUT_MANIFEST, missing_ok=False)
+    added, changed, removed = diff_output_manifests(old, new)
+    for status, paths in (("A", added), ("M", changed), ("D", removed)):
+        for path in paths:
+            print(f"{status}\t{path}")
+    # Summary on stderr so stdout can be piped straight into a deploy script
+    print(f"{len(added)} added, {len(changed)} changed, {len(removed)} removed", file=sys.stderr)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "serve":
+        serve(args)
+    elif args.command == "diff":
+        diff(args)
+    elif args.command == "vendor":
+        vendor(args)
+    elif not build_site(args):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
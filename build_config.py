@@ -16,3 +16,61 @@ USE_TYPST_HTML_FOR_PAGES = True  # Typst HTML for pages
 # Base URL for deployment (e.g., "/Blog" for GitHub Pages, "" for local/root)
 # Defaults to empty string for local development
 BASE_URL = os.getenv("BASE_URL", "")
+
+# Origin the site is deployed at, used for the absolute URLs in feed.xml and sitemap.xml
+SITE_URL = os.getenv("SITE_URL", "https://arham-lodha.github.io")
+
+# Title and author name of the Atom feed
+FEED_TITLE = "Math Major"
+
+# How math is rendered: "svg" prerenders it with typst at build time (pages only load
+# MathJax if some expression couldn't be rendered), "mathjax" typesets it in the browser
+MATH_RENDERER = "svg"
+
+# Route pandoc conversions through one long-lived `pandoc server` process instead of
+# starting pandoc for every call (falls back to the CLI if the server isn't available),
+# with at most PANDOC_SERVER_CONCURRENCY requests in flight
+PANDOC_SERVER = False
+PANDOC_SERVER_CONCURRENCY = 4
+
+# Posts per page on the blog index and on each /blog/tags/<tag>/ page
+BLOG_PAGE_SIZE = 10
+
+# Precompressed siblings written next to HTML, CSS, JS, JSON and SVG outputs of at least
+# PRECOMPRESS_MIN_BYTES ("zst" needs the zstandard package), disabled by --no-compress
+PRECOMPRESS_FORMATS = ("gz", "zst")
+PRECOMPRESS_MIN_BYTES = 1024
+
+# Upper bound for the on-disk compile and math caches in .cache/compile and .cache/math together
+# (least recently used entries are evicted)
+COMPILE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Number of posts compiled in parallel (None = one per CPU core), overridden by --jobs
+BUILD_JOBS = None
+
+# Limits for every typst/pandoc run: wall time in seconds (overridden by --timeout) and
+# address space in bytes. A run that exceeds them is killed and counts as a failed compile.
+TOOL_TIMEOUT = 120
+TOOL_MEMORY_LIMIT = 4 * 1024 * 1024 * 1024
+
+# Failed compiles tolerated before the build is aborted: None builds everything and reports
+# failures at the end, 0 stops at the first one. Overridden by --max-failures/--fail-fast
+MAX_FAILURES = None
+
+# Tool runs taking at least this many seconds are listed at the end of the build
+SLOW_TOOL_SECONDS = 10
+
+# Compile Typst in-process through its Python bindings (pip install typst) instead of
+# spawning `typst compile` per document. Only used if a probe document comes out
+# byte-identical to the CLI's output, otherwise the build falls back to the CLI.
+# TOOL_MEMORY_LIMIT doesn't apply in-process, and a compile past TOOL_TIMEOUT is abandoned
+# in a background thread rather than killed
+TYPST_IN_PROCESS = False
+
+# Inline the stylesheet rules used by the top of each page and load the full stylesheet
+# without blocking rendering
+INLINE_CRITICAL_CSS = True
+
+# Posts at the top of each blog listing page that browsers are hinted to prefetch
+# (posts always prefetch their newer and older neighbours)
+PREFETCH_POSTS = 3
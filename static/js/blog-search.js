@@ -1,46 +1,173 @@
 // Blog search and filter functionality
+//
+// Full-text search runs against the inverted index that build.py writes to
+// static/search/. Nothing is fetched until the first query; after that only
+// the shards covering the query's terms are loaded, each at most once.
 
-document.addEventListener('DOMContentLoaded', function () {
-    const searchInput = document.getElementById('search-input');
-    const tagButtons = document.querySelectorAll('.tag-btn');
-    const postItems = document.querySelectorAll('.post-item');
+(function () {
+    // Resolve static/search/ relative to this script so it works under any BASE_URL
+    const script = document.currentScript;
+    const searchBase = new URL('../search/', script ? script.src : window.location.href);
 
-    let currentTag = 'all';
-    let searchTerm = '';
+    // Must match search_terms() in build.py
+    const STOPWORDS = new Set(('a an and are as at be but by for from has have in is it its of on or ' +
+        'that the this to was were will with we i you').split(' '));
+    const MIN_QUERY_LENGTH = 2;
+    const DEBOUNCE_MS = 150;
 
-    // Search functionality
-    if (searchInput) {
-        searchInput.addEventListener('input', function (e) {
-            searchTerm = e.target.value.toLowerCase();
-            filterPosts();
-        });
-    }
+    const cache = new Map();
 
-    // Tag filter functionality
-    tagButtons.forEach(button => {
-        button.addEventListener('click', function () {
-            // Update active button
-            tagButtons.forEach(btn => btn.classList.remove('active'));
-            this.classList.add('active');
+    function fetchJSON(name) {
+        if (!cache.has(name)) {
+            const request = fetch(new URL(name, searchBase)).then(response => {
+                if (!response.ok) {
+                    throw new Error(`Failed to load ${name}: ${response.status}`);
+                }
+                return response.json();
+            });
+            // Allow a failed request to be retried by a later query
+            request.catch(() => cache.delete(name));
+            cache.set(name, request);
+        }
+        return cache.get(name);
+    }
 
-            currentTag = this.dataset.tag;
-            filterPosts();
-        });
-    });
+    function tokenize(text) {
+        return (text.toLowerCase().match(/[\p{L}\p{N}]+/gu) || [])
+            .filter(term => term.length >= MIN_QUERY_LENGTH && !STOPWORDS.has(term));
+    }
 
-    function filterPosts() {
-        postItems.forEach(item => {
-            const title = item.textContent.toLowerCase();
-            const tags = item.dataset.tags ? item.dataset.tags.split(',') : [];
+    // Shards that can hold `term`: the one with the longest prefix of it and, for
+    // prefix lookups, every shard split off below `term`
+    function shardsFor(term, isPrefix, shards) {
+        const covering = shards.filter(prefix => term.startsWith(prefix));
+        const selected = covering.length ? [covering.reduce((a, b) => (b.length > a.length ? b : a))] : [];
+        if (isPrefix) {
+            selected.push(...shards.filter(prefix => prefix.length > term.length && prefix.startsWith(term)));
+        }
+        return selected;
+    }
 
-            const matchesSearch = searchTerm === '' || title.includes(searchTerm);
-            const matchesTag = currentTag === 'all' || tags.includes(currentTag);
+    function decodePostings(deltas) {
+        let id = 0;
+        return deltas.map(delta => (id += delta));
+    }
 
-            if (matchesSearch && matchesTag) {
-                item.style.display = '';
-            } else {
-                item.style.display = 'none';
+    // Document IDs matching `term`; a prefix term matches every indexed term it starts
+    async function lookup(term, isPrefix, meta) {
+        const ids = new Set();
+        const shards = await Promise.all(
+            shardsFor(term, isPrefix, meta.shards).map(prefix => fetchJSON(`shard-${prefix}.json?v=${meta.version}`))
+        );
+        for (const shard of shards) {
+            if (!isPrefix) {
+                if (shard[term]) {
+                    decodePostings(shard[term]).forEach(id => ids.add(id));
+                }
+                continue;
             }
-        });
+            for (const [indexed, deltas] of Object.entries(shard)) {
+                if (indexed.startsWith(term)) {
+                    decodePostings(deltas).forEach(id => ids.add(id));
+                }
+            }
+        }
+        return ids;
+    }
+
+    async function search(query) {
+        const terms = tokenize(query);
+        if (!terms.length) {
+            return null;
+        }
+        const meta = await fetchJSON('meta.json');
+        const [docs, ...matches] = await Promise.all([
+            fetchJSON(`${meta.docs}?v=${meta.version}`),
+            // Every term but the last is complete; the last may still be being typed
+            ...terms.map((term, i) => lookup(term, i === terms.length - 1, meta)),
+        ]);
+        matches.sort((a, b) => a.size - b.size);
+        const [smallest, ...rest] = matches;
+        return [...smallest]
+            .filter(id => rest.every(ids => ids.has(id)))
+            .sort((a, b) => a - b)
+            .map(id => docs[id]);
     }
-});
+
+    function escapeHTML(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
+
+    function renderResult([title, url, date, tags, abstract]) {
+        let html = `<li class='post-item' data-tags='${escapeHTML(tags.join(','))}'>`;
+        html += `<div class='post-header'><a href='${escapeHTML(url)}'>${escapeHTML(title)}</a>`;
+        html += `<span class='post-date'>${escapeHTML(date)}</span></div>`;
+        if (abstract) {
+            html += `<p class='post-abstract'>${escapeHTML(abstract)}</p>`;
+        }
+        if (tags.length) {
+            html += `<div class='post-tags'>${tags.map(tag => `<span class='tag'>${escapeHTML(tag)}</span>`).join(' ')}</div>`;
+        }
+        return html + '</li>';
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        const searchInput = document.getElementById('search-input');
+        const results = document.getElementById('search-results');
+        // The page's own listing and pagination, hidden while search results are shown
+        const listing = document.querySelectorAll('.post-list:not(#search-results), .pagination');
+        // Tag pages are generated statically; on one, search only within its tag
+        const activeTag = document.querySelector('.tag-btn.active');
+        const currentTag = activeTag ? activeTag.dataset.tag : 'all';
+
+        let currentResults = null;
+        let pending = 0;
+        let timer = null;
+
+        // Search functionality
+        if (searchInput) {
+            searchInput.addEventListener('input', function () {
+                clearTimeout(timer);
+                timer = setTimeout(runSearch, DEBOUNCE_MS);
+            });
+        }
+
+        async function runSearch() {
+            // Drop results of queries that were overtaken by newer input
+            const id = ++pending;
+            let found;
+            try {
+                found = await search(searchInput.value);
+            } catch (error) {
+                console.error(error);
+                return;
+            }
+            if (id === pending) {
+                currentResults = found;
+                render();
+            }
+        }
+
+        function matchesTag(tags) {
+            return currentTag === 'all' || tags.includes(currentTag);
+        }
+
+        function render() {
+            if (currentResults === null || !results) {
+                if (results) {
+                    results.hidden = true;
+                }
+                listing.forEach(element => (element.hidden = false));
+                return;
+            }
+            const shown = currentResults.filter(doc => matchesTag(doc[3]));
+            results.innerHTML = shown.length
+                ? shown.map(renderResult).join('')
+                : "<li class='post-item'>No posts found.</li>";
+            results.hidden = false;
+            listing.forEach(element => (element.hidden = true));
+        }
+    });
+})();
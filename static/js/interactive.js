@@ -0,0 +1,71 @@
+// Lazy mounting of interactive components
+//
+// build.py emits each [INTERACTIVE:...] component as a placeholder whose markup
+// sits inert in a <template>. When a placeholder comes near the viewport, the
+// libraries it needs are loaded (each at most once per page, in order) and its
+// markup and scripts are mounted in place.
+
+(function () {
+    const ROOT_MARGIN = '200px';
+    const loaded = new Map();
+
+    function loadScript(src) {
+        if (!loaded.has(src)) {
+            loaded.set(src, new Promise((resolve, reject) => {
+                const script = document.createElement('script');
+                script.src = src;
+                script.onload = resolve;
+                script.onerror = () => reject(new Error(`Failed to load ${src}`));
+                document.head.appendChild(script);
+            }));
+        }
+        return loaded.get(src);
+    }
+
+    async function mount(placeholder, libraries) {
+        const indices = (placeholder.dataset.libraries || '').split(' ').filter(Boolean);
+        // Libraries may depend on each other, so load them in the component's order
+        for (const index of indices) {
+            await loadScript(libraries[Number(index)]);
+        }
+
+        const template = placeholder.querySelector('template');
+        const content = template.content.cloneNode(true);
+        const scripts = [...content.querySelectorAll('script')];
+        template.replaceWith(content);
+        placeholder.classList.remove('interactive-lazy');
+
+        // Scripts that come from a template never run, replace them with fresh copies
+        for (const inert of scripts) {
+            const script = document.createElement('script');
+            for (const attribute of inert.attributes) {
+                script.setAttribute(attribute.name, attribute.value);
+            }
+            script.textContent = inert.textContent;
+            inert.replaceWith(script);
+        }
+    }
+
+    function mountAll(placeholders, libraries) {
+        placeholders.forEach(placeholder => {
+            mount(placeholder, libraries).catch(error => console.error(error));
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        const list = document.getElementById('interactive-libraries');
+        const libraries = list ? JSON.parse(list.textContent) : [];
+        const placeholders = document.querySelectorAll('.interactive-lazy[data-interactive]');
+
+        if (!('IntersectionObserver' in window)) {
+            mountAll(placeholders, libraries);
+            return;
+        }
+        const observer = new IntersectionObserver(entries => {
+            const visible = entries.filter(entry => entry.isIntersecting).map(entry => entry.target);
+            visible.forEach(placeholder => observer.unobserve(placeholder));
+            mountAll(visible, libraries);
+        }, { rootMargin: ROOT_MARGIN });
+        placeholders.forEach(placeholder => observer.observe(placeholder));
+    });
+})();
@@ -0,0 +1,16 @@
+// Registers the generated service worker, output/sw.js
+//
+// This script lives in static/js/ under the site root, so resolving the worker
+// against its own URL finds the root (and gives the worker the whole site as its
+// scope) whatever BASE_URL the site is deployed under.
+
+(function () {
+    if (!('serviceWorker' in navigator)) {
+        return;
+    }
+    const url = new URL('../../sw.js', document.currentScript.src);
+    // Wait for the page to finish loading so installing doesn't compete with it
+    window.addEventListener('load', function () {
+        navigator.serviceWorker.register(url.href).catch(error => console.error(error));
+    });
+})();
@@ -0,0 +1,67 @@
+// Lazy loading of multi-page Typst SVG documents
+//
+// build.py inlines the first page of a document and leaves a placeholder, sized
+// like the page, for each later page. When a placeholder comes near the viewport
+// its page is fetched and inlined. Later pages don't carry glyph definitions: they
+// use the first page's, plus the document's glyph sprite, which is fetched once.
+
+(function () {
+    const ROOT_MARGIN = '800px';
+    const sprites = new Map();
+
+    function fetchText(url) {
+        return fetch(url).then(response => {
+            if (!response.ok) {
+                throw new Error(`Failed to load ${url}: ${response.status}`);
+            }
+            return response.text();
+        });
+    }
+
+    function loadSprite(url) {
+        if (!url) {
+            return Promise.resolve();
+        }
+        if (!sprites.has(url)) {
+            sprites.set(url, fetchText(url).then(svg => {
+                // <use> references resolve against the whole document
+                const holder = document.createElement('div');
+                holder.hidden = true;
+                holder.innerHTML = svg;
+                document.body.appendChild(holder);
+            }));
+        }
+        return sprites.get(url);
+    }
+
+    async function load(page) {
+        const container = page.closest('.typst-svg-container');
+        const [svg] = await Promise.all([
+            fetchText(page.dataset.src),
+            loadSprite(container && container.dataset.glyphs),
+        ]);
+        page.innerHTML = svg;
+        page.classList.remove('typst-svg-lazy');
+    }
+
+    function loadAll(pages) {
+        pages.forEach(page => {
+            load(page).catch(error => console.error(error));
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        const pages = document.querySelectorAll('.typst-svg-lazy[data-src]');
+
+        if (!('IntersectionObserver' in window)) {
+            loadAll(pages);
+            return;
+        }
+        const observer = new IntersectionObserver(entries => {
+            const visible = entries.filter(entry => entry.isIntersecting).map(entry => entry.target);
+            visible.forEach(page => observer.unobserve(page));
+            loadAll(visible);
+        }, { rootMargin: ROOT_MARGIN });
+        pages.forEach(page => observer.observe(page));
+    });
+})();
@@ -0,0 +1,89 @@
+// Service worker generated by build.py, do not edit output/sw.js
+//
+// PRECACHE maps the site shell (home page, blog index, stylesheets, scripts and
+// search index) to content hashes and is fetched on install. Every other output
+// is in PAGES: cached the first time it is requested, then served
+// stale-while-revalidate. Cache keys carry the content hash, so after a deploy
+// only entries whose hash changed are fetched again and the rest stay cached.
+
+const PRECACHE = {{ precache }};
+const PAGES = {{ pages }};
+const PRECACHE_NAME = 'precache';
+const PAGES_NAME = 'pages';
+
+function cacheKey(path, hash) {
+    return new URL(`${path}?__sw_rev=${hash}`, self.location).href;
+}
+
+function requestPath(url) {
+    // A directory URL and its index.html are the same page
+    return url.pathname.endsWith('/index.html') ? url.pathname.slice(0, -'index.html'.length) : url.pathname;
+}
+
+self.addEventListener('install', event => {
+    event.waitUntil((async () => {
+        const cache = await caches.open(PRECACHE_NAME);
+        await Promise.all(Object.entries(PRECACHE).map(async ([path, hash]) => {
+            const key = cacheKey(path, hash);
+            if (await cache.match(key)) {
+                return;
+            }
+            const response = await fetch(path, { cache: 'no-cache' });
+            if (!response.ok) {
+                throw new Error(`Failed to precache ${path}: ${response.status}`);
+            }
+            await cache.put(key, response);
+        }));
+        await self.skipWaiting();
+    })());
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil((async () => {
+        // Drop entries whose content changed or that are no longer part of the site
+        const current = new Set([PRECACHE, PAGES].flatMap(
+            entries => Object.entries(entries).map(([path, hash]) => cacheKey(path, hash))
+        ));
+        for (const name of [PRECACHE_NAME, PAGES_NAME]) {
+            const cache = await caches.open(name);
+            for (const request of await cache.keys()) {
+                if (!current.has(request.url)) {
+                    await cache.delete(request);
+                }
+            }
+        }
+        await self.clients.claim();
+    })());
+});
+
+async function staleWhileRevalidate(event, path) {
+    const cache = await caches.open(PAGES_NAME);
+    const key = cacheKey(path, PAGES[path]);
+    const cached = await cache.match(key);
+    const network = fetch(event.request).then(response => {
+        if (response.ok) {
+            event.waitUntil(cache.put(key, response.clone()));
+        }
+        return response;
+    });
+    if (!cached) {
+        return network;
+    }
+    event.waitUntil(network.catch(() => undefined));
+    return cached;
+}
+
+self.addEventListener('fetch', event => {
+    const url = new URL(event.request.url);
+    if (event.request.method !== 'GET' || url.origin !== self.location.origin) {
+        return;
+    }
+    const path = requestPath(url);
+    if (path in PRECACHE) {
+        event.respondWith(caches.open(PRECACHE_NAME)
+            .then(cache => cache.match(cacheKey(path, PRECACHE[path])))
+            .then(cached => cached || fetch(event.request)));
+    } else if (path in PAGES) {
+        event.respondWith(staleWhileRevalidate(event, path));
+    }
+});